@@ -1,6 +1,11 @@
 from django.contrib import admin
-from .models import ActivityLink, Certificate, CourseModule
+from .models import (ActivityLink, Certificate, CertificateCodeAlias, CoordinatorDigest, CoordinatorDigestEntry,
+                     CourseModule, OutboxEmail)
 
 admin.site.register(ActivityLink)
 admin.site.register(Certificate)
-admin.site.register(CourseModule)
\ No newline at end of file
+admin.site.register(CertificateCodeAlias)
+admin.site.register(CoordinatorDigest)
+admin.site.register(CoordinatorDigestEntry)
+admin.site.register(CourseModule)
+admin.site.register(OutboxEmail)
\ No newline at end of file
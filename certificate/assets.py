@@ -0,0 +1,114 @@
+import os
+import threading
+from fpdf import FPDF
+
+from django.conf import settings
+
+
+#######################################
+# ASSETS
+#######################################
+FONTS = {
+    "Baloo2-Regular": "fonts/Baloo2-Regular.ttf",
+    "Baloo2-Bold": "fonts/Baloo2-Bold.ttf",
+}
+
+IMAGES = {
+    "background": "images/wikiconecta-background.png",
+    "header": "images/wikiconecta-header.png",
+    "alex": "images/alex.png",
+    "jap": "images/jap.png",
+}
+
+# Copies of the images resized to the size in which they are printed, created by the optimize_images command.
+# The originals are used while the copies don't exist
+DERIVED_IMAGES_DIR = "images/derived"
+# Images drawn directly on the blank page, whose transparency can be flattened on white
+FLATTENED_IMAGES = {"background", "header"}
+
+_lock = threading.Lock()
+_fonts = {}
+_images = {}
+
+
+def asset_path(relative_path):
+    return os.path.join(settings.STATIC_ROOT, relative_path)
+
+
+def derived_image_path(name):
+    return os.path.join(asset_path(DERIVED_IMAGES_DIR), name + ".png")
+
+
+def image_path(name):
+    """
+    Path of a registered image, used by the generators as the key of the preloaded image in the document
+    :param name: key of the image in IMAGES
+    :return: absolute path of the optimized copy of the image, or of the original if there is no copy
+    """
+    path = derived_image_path(name)
+    if os.path.exists(path):
+        return path
+    return asset_path(IMAGES[name])
+
+
+def get_font(family):
+    """
+    Parses the metrics of a TrueType font only the first time it is requested by this worker
+    :param family: key of the font in FONTS
+    :return: the font and font file descriptors built by fpdf
+    """
+    with _lock:
+        if family not in _fonts:
+            parser = FPDF()
+            parser.add_font(family=family, fname=asset_path(FONTS[family]), uni=True)
+            fontkey = family.lower()
+            _fonts[family] = (parser.fonts[fontkey], parser.font_files[fontkey])
+        return _fonts[family]
+
+
+def get_image(name):
+    """
+    Reads and decodes an image only the first time it is requested by this worker
+    :param name: key of the image in IMAGES
+    :return: the image descriptor built by fpdf and the PDF version it requires (images with alpha need 1.4)
+    """
+    with _lock:
+        if name not in _images:
+            parser = FPDF()
+            info = parser._parsepng(image_path(name))
+            _images[name] = (info, parser.pdf_version)
+        return _images[name]
+
+
+def load_assets(pdf, fonts=(), images=()):
+    """
+    Registers the preloaded fonts and images in a document, so fpdf doesn't parse the files again.
+    fpdf writes the object numbers and the subset of characters used in these descriptors, so each
+    document receives its own copy of them, while the metrics and the image data are shared.
+    The widths cache that fpdf pickles next to the font is disabled, since it is written and read without
+    any locking and breaks when documents are generated in parallel processes
+    :param FPDF pdf: document being generated
+    :param fonts: keys of the fonts in FONTS used by the document
+    :param images: keys of the images in IMAGES used by the document
+    """
+    for family in fonts:
+        font, font_file = get_font(family)
+        fontkey = family.lower()
+        pdf.fonts[fontkey] = dict(font, i=len(pdf.fonts) + 1, subset=list(font["subset"]), unifilename=None)
+        pdf.font_files[fontkey] = dict(font_file)
+        pdf.font_files[asset_path(FONTS[family])] = {"type": "TTF"}
+
+    for name in images:
+        info, pdf_version = get_image(name)
+        pdf.images[image_path(name)] = dict(info, i=len(pdf.images) + 1)
+        pdf.pdf_version = max(pdf.pdf_version, pdf_version)
+
+
+def preload_assets():
+    """
+    Loads every font and image of the registry, to be called when a worker starts
+    """
+    for family in FONTS:
+        get_font(family)
+    for name in IMAGES:
+        get_image(name)
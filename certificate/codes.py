@@ -0,0 +1,84 @@
+import base64
+import binascii
+import re
+import struct
+from collections import namedtuple
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+
+#######################################
+# VALIDATION CODES
+#######################################
+# A validation code is a signed token with the id, the type and the issue date of the document, so it can be checked
+# with the SECRET_KEY alone. The documents issued before the signed codes keep their 40-character sha1 code,
+# that can only be checked in the database
+CODE_VERSION = 1
+CODE_SALT = "certificate.codes"
+CODE_EPOCH = date(2000, 1, 1)
+CODE_TYPES = ("enrollment", "certificate")
+CODE_MAC_SIZE = 12
+# version, certificate id, type, days since CODE_EPOCH
+CODE_PAYLOAD = struct.Struct(">BIBH")
+LEGACY_CODE = re.compile(r"^[0-9a-fA-F]{40}$")
+
+SignedCode = namedtuple("SignedCode", ["certificate_id", "certificate_type", "date_issued"])
+
+
+def sign(payload, secret=None):
+    return salted_hmac(CODE_SALT, payload, secret=secret, algorithm="sha256").digest()[:CODE_MAC_SIZE]
+
+
+def make_code(certificate_id, certificate_type, date_issued):
+    """
+    Creates the validation code of a document
+    :param certificate_id: id of the Certificate
+    :param certificate_type: "enrollment" or "certificate"
+    :param date_issued: date (or datetime) in which the document was issued
+    :return: a 32-character code of uppercase letters and digits
+    """
+    if hasattr(date_issued, "date"):
+        date_issued = date_issued.date()
+    payload = CODE_PAYLOAD.pack(CODE_VERSION, certificate_id, CODE_TYPES.index(certificate_type), (date_issued - CODE_EPOCH).days)
+    # The signature goes first, so the codes spread evenly in the directories of the store of issued documents
+    return base64.b32encode(sign(payload) + payload).decode("ascii")
+
+
+def normalize_code(code):
+    """
+    Codes are typed by people: spaces are ignored and the codes are accepted in any case. The sha1 codes are stored
+    in lowercase and the signed codes in uppercase
+    """
+    code = "".join((code or "").split())
+    return code.lower() if is_legacy_code(code) else code.upper()
+
+
+def is_legacy_code(code):
+    return bool(LEGACY_CODE.match(code))
+
+
+def read_code(code):
+    """
+    Checks the signature of a validation code, without looking for the document in the database
+    :param code: normalized validation code
+    :return: the SignedCode or None if the code is garbled or was not signed with the SECRET_KEY (or one of the
+    SECRET_KEY_FALLBACKS)
+    """
+    try:
+        token = base64.b32decode(code)
+    except (binascii.Error, ValueError):
+        return None
+    if len(token) != CODE_PAYLOAD.size + CODE_MAC_SIZE:
+        return None
+
+    mac, payload = token[:CODE_MAC_SIZE], token[CODE_MAC_SIZE:]
+    secrets = [settings.SECRET_KEY] + list(getattr(settings, "SECRET_KEY_FALLBACKS", []))
+    if not any(constant_time_compare(mac, sign(payload, secret)) for secret in secrets):
+        return None
+
+    version, certificate_id, type_index, days = CODE_PAYLOAD.unpack(payload)
+    if version != CODE_VERSION or type_index >= len(CODE_TYPES):
+        return None
+    return SignedCode(certificate_id, CODE_TYPES[type_index], CODE_EPOCH + timedelta(days=days))
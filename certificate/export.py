@@ -0,0 +1,72 @@
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.utils import timezone
+
+# Documents rendered at the same time while an archive is streamed
+EXPORT_WORKERS = 2
+
+
+#######################################
+# ZIP EXPORT
+#######################################
+class ZipStream:
+    """
+    Write-only file for zipfile that keeps only the bytes not sent to the client yet. As it can't seek, zipfile writes
+    the sizes and checksums of each file after its data, and the central directory at the end
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(documents, workers=EXPORT_WORKERS):
+    """
+    Generates a ZIP archive piece by piece, as its documents are rendered. At most a few documents are held in memory
+    at a time, however large the archive is. The documents are rendered by threads, since forking a web worker is not
+    safe, and are added in the order they are given
+    :param documents: iterable of (filename, function, arguments), where the function returns the bytes of the file
+    :param workers: number of documents rendered at the same time
+    :return: generator of the bytes of the archive
+    """
+    stream = ZipStream()
+    archive = zipfile.ZipFile(stream, mode="w", compression=zipfile.ZIP_STORED)
+    date_time = timezone.localtime().timetuple()[:6]
+    failures = []
+
+    def add(filename, job):
+        try:
+            content = job.result()
+        except Exception as error:
+            failures.append("{}: {}".format(filename, error))
+            return
+        # PDFs are already compressed, so they are stored as they are
+        archive.writestr(zipfile.ZipInfo(filename, date_time), content)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for filename, function, arguments in documents:
+            pending.append((filename, executor.submit(function, *arguments)))
+            if len(pending) > workers:
+                add(*pending.popleft())
+                yield stream.pop()
+        while pending:
+            add(*pending.popleft())
+            yield stream.pop()
+
+    if failures:
+        archive.writestr(zipfile.ZipInfo("errors.txt", date_time), "\n".join(failures))
+    archive.close()
+    yield stream.pop()
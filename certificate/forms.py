@@ -1,8 +1,27 @@
 from django import forms
-from .models import CourseModule, ActivityLink
+from django.utils.translation import gettext_lazy as _
+from .models import CourseModule, ActivityLink, activity_module_ids
+
+# Modules with an activity to be submitted for the certificate of completion
+NUMBER_OF_ACTIVITIES = 5
 
 
 class ActivityLinkForm(forms.ModelForm):
     class Meta:
         model = ActivityLink
         fields = ['link']
+
+
+class BaseActivityLinkFormSet(forms.BaseFormSet):
+    def clean(self):
+        """
+        Each link is saved in the module of its position, so the request is refused while the modules of the
+        activities are not all registered, instead of dropping the links of the missing ones
+        """
+        super().clean()
+        if len(activity_module_ids()) < NUMBER_OF_ACTIVITIES:
+            raise forms.ValidationError(_("The activities of the course are not available yet. Please try again later."))
+
+
+ActivityLinkFormSet = forms.formset_factory(ActivityLinkForm, formset=BaseActivityLinkFormSet, min_num=NUMBER_OF_ACTIVITIES,
+                                            max_num=NUMBER_OF_ACTIVITIES, extra=0, validate_min=True, validate_max=True)
@@ -0,0 +1,438 @@
+import math
+import re
+from functools import lru_cache
+
+from babel import Locale
+from babel.dates import format_date
+from django.conf import settings
+from django.utils import translation
+from django.utils.functional import Promise
+from django.utils.translation import gettext_lazy as _
+
+from certificate.assets import image_path
+
+
+#######################################
+# LAYOUT BLOCKS
+#######################################
+# A layout is a list of operations over the FPDF document. Each operation is a tuple with the name of the FPDF
+# method (or a function that receives the document and the context) and its keyword arguments. The texts are
+# translated when the layout is compiled, and the ones marked as fields are formatted with the data of the
+# participant when the document is drawn.
+def font(family, style="", size=0):
+    return "set_font", {"family": family, "style": style, "size": size}
+
+
+def set_xy(x, y):
+    return "set_xy", {"x": x, "y": y}
+
+
+def set_x(value):
+    return "set_x", {"x": value}
+
+
+def set_y(value):
+    return "set_y", {"y": value}
+
+
+def text_color(r, g, b):
+    return "set_text_color", {"r": r, "g": g, "b": b}
+
+
+def image(name, **position):
+    return "image", dict(position, name=name)
+
+
+def cell(w, h, txt="", fields=False, **kwargs):
+    return "cell", dict(kwargs, w=w, h=h, txt=txt, fields=fields)
+
+
+def multi_cell(w, h, txt, fields=False, **kwargs):
+    return "multi_cell", dict(kwargs, w=w, h=h, txt=txt, fields=fields)
+
+
+def new_page():
+    return "add_page", {}
+
+
+def unit(txt, h=9):
+    """
+    Item of the list of units of a module in the enrollment letter
+    """
+    return [set_x(42.5), cell(w=50, h=h, txt=txt, border=0, ln=1, align='L')]
+
+
+def module(txt):
+    """
+    Title of a module in the enrollment letter
+    """
+    return [font('Times', 'B', 13),
+            cell(w=0, h=9, txt=txt, border=0, ln=1, align='L'),
+            font('Times', '', 13)]
+
+
+def draw_certificate_name(pdf, context):
+    """
+    Writes the name of the participant in the certificate, abbreviating the middle names and shrinking the font
+    when it doesn't fit in the page
+    """
+    name = context["name"]
+    pdf.set_font('Baloo2-Regular', '', 35)
+    name_size = pdf.get_string_width(name)
+
+    if name_size > 287:
+        # Try to eliminate the prepositions
+        name_split = [name_part for name_part in name.split(' ') if not name_part.islower()]
+        # There's a first and last names and at least one middle name
+        if len(name_split) > 2:
+            first_name = name_split[0]
+            last_name = name_split[-1]
+            middle_names = [md_name[0] + '.' for md_name in name_split[1:-1]]
+            name = first_name + ' ' + ' '.join(middle_names) + ' ' + last_name
+            name_size = pdf.get_string_width(name)
+
+        # Even abbreviating, there is still the possibility that the name is too big, so
+        # we need to adjust it to the proper size
+        if name_size > 287:
+            pdf.set_font('Baloo2-Regular', '', math.floor(287 * 35 / name_size))
+
+    pdf.set_y(55)
+    pdf.cell(w=0, h=10, border=0, ln=1, align='C', txt=name)
+
+
+#######################################
+# LAYOUTS
+#######################################
+FOOTER_TEXT = _('The validity of this document can be checked at https://wikiconecta.toolforge.org/\nThe validation code is: {code}')
+
+ENROLLMENT_LETTER = {
+    "orientation": "P",
+    "footer": FOOTER_TEXT,
+    "formats": {"date": _("%B %d, %Y")},
+    "blocks": [
+        ("set_margins", {"left": 30, "top": 10, "right": 20}),
+        new_page(),
+        ("set_draw_color", {"r": 75, "g": 82, "b": 209}),
+        text_color(255, 255, 255),  # Title in white color
+        image('header', x=0, y=0, w=210),
+        # Title
+        font('Baloo2-Bold', '', 25),
+        set_x(30),
+        cell(w=150, h=12, border=0, ln=1, align='C', fill=False, txt='WikiConecta'),
+        text_color(0, 0, 0),
+        # Date
+        set_xy(30, 42),
+        font('Times', '', 13),
+        cell(w=150, h=9, border=0, ln=1, align='L', txt=[_('São Paulo, '), "{date}"], fields=True),
+        cell(w=0, h=9, ln=1),  # New line
+        # To whom it may concern
+        font('Times', 'B', 13),
+        cell(w=150, h=9, txt=_('To whom it may concern'), border=0, ln=1, align='L'),
+        cell(w=0, h=9, ln=1),  # New line
+        # Text
+        font('Times', '', 13),
+        multi_cell(w=0, h=9, border=0, align='J', txt=_("""The WikiConecta course (https://w.wiki/7KwX) was developed by Wiki Movimento Brasil, a non-profit organization that works towards free knowledge under CNPJ 29.801.908/0001-86. To complete it, 20 hours of dedication are required, asynchronously and independently, and the course is available on an open online education platform, the Wikiversity.\n\nThe units were developed by Professor Amanda Chevtchouk Jurno, PhD, former Education and Scientific Dissemination Manager at Wiki Movimento Brasil, with scientific guidance from Professor João Alexandre Peschanski, PhD, Executive Director of Wiki Movimento Brasil. In order to adapt the content to the expectations of the Wikimedia Movement and ensure that it covered the information necessary to introduce educators to this universe, the course had strategic guidance from senior members of the Movement working in the area of Education in various regions of the world.\n\nThe objective of the course is to present in a condensed form the information that educators need to start using the Wikimedia projects with their students, especially in university extension. At the end of the course, participants should be able to basic edit four Wikimedia projects - Wikipedia, Wikidata, Wikimedia Commons and Wikiversity - and develop their own wiki-education programs, aiming to comply with Brazilian university extension guidelines.""")),
+        # Modules and units
+        new_page(),
+        set_xy(30, 30),
+        cell(w=0, h=9, txt=_('The WikiConecta is divided into six modules, each one divided into several units:'), border=0, ln=1, align='L'),
+        *module(_('Module 1: Introduction')),
+        *unit(_('Free Knowledge: potentials and advantages of using the Wikimedia Projects')),
+        *unit(_('The Wikimedia Projects and Organizations')),
+        *unit(_('Collective ntelligence and open data')),
+        *unit(_('Wikimedia programs, initiatives and events')),
+        *module(_('Module 2: Wikipedia')),
+        *unit(_('Wikipedia as an educational resource')),
+        *unit(_('Diffusion and scientific dissemination on Wikipedia')),
+        *unit(_('Content and equity gaps')),
+        *unit(_('Principles and foundations of Wikipedia')),
+        *unit(_('Entries and arrangement of information'), h=8),
+        *unit(_('Editing Wikipedia')),
+        *unit(_('Using Wikipedia with students')),
+        *module(_('Module 3: Wikidata')),
+        *unit(_('The Wikimedia structured database')),
+        *unit(_('Getting data: Wikidata Query Service and Scholia')),
+        *unit(_('Entering data: how to use Zotero')),
+        *unit(_('Bias and subjectivity in data')),
+        *unit(_('Editing Wikidata')),
+        *unit(_('Using Wikidata with students')),
+        *module(_('Module 4: Wikimedia Commons')),
+        *unit(_('Wikimedia audiovisual repository')),
+        *unit(_('Creative commons and free licenses')),
+        *unit(_('How to use Wikimedia Commons')),
+        *unit(_('File upload')),
+        *unit(_('Using Wikimedia Commons with students')),
+        font('Times', 'B', 13),
+        new_page(),
+        set_xy(30, 30),
+        cell(w=0, h=9, txt=_('Module 5: Wikiversity'), border=0, ln=1, align='L'),
+        font('Times', '', 13),
+        *unit(_('Wikiversity - the free university')),
+        *unit(_('Open Educational Resources (OER) and Massive Open Online Courses (MOOCs)')),
+        *unit(_('Editing the Wikiversity')),
+        *unit(_('Using Wikiversity with students')),
+        *module(_('Module 6: Education programs')),
+        *unit(_('Creating an education program with Wiki')),
+        *unit(_('Program monitoring: Dashboard')),
+        *unit(_('Potential financiers')),
+        *unit(_('Wikimedia and Education in Brazil')),
+        cell(w=0, h=9, ln=1),  # New line
+        multi_cell(w=0, h=9, border=0, align='J', fields=True, txt=_("""The course is free and the control of activities is carried out by resources on Wikimedia. This letter certifies that {name} is able to participate in the WikiConecta course. If requested, we can issue a declaration of course completion, once the participant has completed the proposed readings and activities.\n\nPlease do not hesitate to contact us to receive further information regarding the course.\n\nYours sincerely,""")),
+        font('Times', '', 13),
+        # Signatures
+        cell(w=0, h=13, ln=1),
+        image('alex', x=56, y=223, w=28, h=16),
+        set_y(230),
+        multi_cell(w=80, h=9, border=0, align='C', txt=_("_________________________________\nALEXANDER MAXIMILIAN HILSENBECK FILHO\nCoordinator\nWikiConecta")),
+        set_xy(110, 230),
+        image('jap', x=140.5, y=227, w=18, h=16),
+        multi_cell(w=80, h=9, border=0, align='C', txt=_("_________________________________\nJOÃO ALEXANDRE PESCHANSKI\nExecutive Director\nWiki Movimento Brasil")),
+    ],
+}
+
+CERTIFICATE = {
+    "orientation": "L",
+    "footer": FOOTER_TEXT,
+    "formats": {},
+    "blocks": [
+        new_page(),
+        text_color(74, 81, 210),  # purple
+        # Header
+        image('background', x=0, y=0, w=297, h=210),
+        set_y(20),
+        font('Baloo2-Regular', '', 37),
+        cell(w=0, h=10, border=0, ln=1, align='C', txt=_('CERTIFICATE')),
+        set_y(36),
+        font('Baloo2-Regular', '', 15),
+        cell(w=0, h=10, border=0, ln=1, align='C', txt=_('We grant this certificate to')),
+        # Name of the participant
+        (draw_certificate_name, {}),
+        cell(w=0, h=10, ln=1),  # New line
+        # For having completed the course
+        font('Baloo2-Regular', '', 15),
+        set_y(70),
+        cell(w=0, h=10, border=0, ln=1, align='C', txt=_('for completing the readings and tasks of the online course')),
+        # Initiative
+        set_xy(164, 86),
+        font('Baloo2-Bold', '', 11),
+        cell(w=20, h=10, border=0, ln=0, align='L', txt=_('Initiative:')),
+        # Signatures
+        set_xy(80, 131),
+        multi_cell(w=80, h=5, border=0, align='C', txt=_("_______________________________________\nALEXANDER MAXIMILIAN HILSENBECK FILHO\nCoordinator\nWikiConecta")),
+        image('alex', x=106, y=122, w=28, h=16),
+        set_xy(155, 131),
+        multi_cell(w=80, h=5, border=0, align='C', txt=_("_________________________________\nJOÃO ALEXANDRE PESCHANSKI\nExecutive Director\nWiki Movimento Brasil")),
+        image('jap', x=186, y=125, w=18, h=16),
+        # Text
+        set_xy(50, 166),
+        multi_cell(w=197, h=5, border=0, align='C', txt=_('''The WikiConecta course does not have record control, readings and tasks are freely accessible.\nThis certificate is therefore not recognized as an official diploma. The course totals twenty hours.''')),
+    ],
+}
+
+LAYOUTS = {
+    "enrollment": ENROLLMENT_LETTER,
+    "certificate": CERTIFICATE,
+}
+
+
+#######################################
+# COMPILATION
+#######################################
+def translate(value):
+    if isinstance(value, Promise):
+        return str(value)
+    if isinstance(value, list):
+        return "".join(translate(part) for part in value)
+    return value
+
+
+# strftime directives used by the translated date formats and their equivalent in the CLDR patterns of babel
+DATE_DIRECTIVES = {
+    "%d": "dd",
+    "%m": "MM",
+    "%b": "MMM",
+    "%B": "MMMM",
+    "%y": "yy",
+    "%Y": "yyyy",
+    "%a": "EEE",
+    "%A": "EEEE",
+    "%%": "%",
+}
+
+
+def to_date_pattern(date_format):
+    """
+    Converts a strftime format, as it is written in the translation files, to a babel pattern
+    """
+    pattern = ""
+    for part in re.split(r"(%.)", date_format):
+        if part in DATE_DIRECTIVES:
+            pattern += DATE_DIRECTIVES[part]
+        elif part:
+            pattern += "'" + part.replace("'", "''") + "'"
+    return pattern
+
+
+def format_layout_date(layout, value, name="date"):
+    """
+    Formats a date in the language of a compiled layout. Unlike locale.setlocale, it doesn't change the state of
+    the process, so documents in different languages can be drawn by concurrent threads
+    """
+    return format_date(value, layout["formats"][name], locale=layout["locale"])
+
+
+@lru_cache(maxsize=None)
+def compile_layout(document_type, language):
+    """
+    Translates the texts of a layout and resolves its images, once per language
+    :param document_type: key of the layout in LAYOUTS, the same as Certificate.certificate_type
+    :param language: language code of the document
+    :return: the layout with plain strings, ready to be drawn
+    """
+    language = language or settings.LANGUAGE_CODE
+    layout = LAYOUTS[document_type]
+    with translation.override(language):
+        blocks = []
+        for method, kwargs in layout["blocks"]:
+            kwargs = {key: translate(value) for key, value in kwargs.items()}
+            fields = kwargs.pop("fields", False)
+            if method == "image":
+                kwargs["name"] = image_path(kwargs["name"])
+            blocks.append((method, kwargs, fields))
+
+        return {
+            "orientation": layout["orientation"],
+            "footer": translate(layout["footer"]),
+            "locale": Locale.parse(translation.to_locale(language)),
+            "formats": {key: to_date_pattern(translate(value)) for key, value in layout["formats"].items()},
+            "blocks": tuple(blocks),
+        }
+
+
+def draw_layout(pdf, layout, context):
+    """
+    Draws a compiled layout in the document
+    :param FPDF pdf: document being generated
+    :param layout: layout compiled by compile_layout
+    :param context: data of the participant that fills the fields of the layout
+    """
+    for block in layout["blocks"]:
+        draw_block(pdf, block, context)
+
+
+def draw_block(pdf, block, context):
+    method, kwargs, fields = block
+    if fields:
+        kwargs = dict(kwargs, txt=kwargs["txt"].format_map(context))
+    if callable(method):
+        method(pdf, context, **kwargs)
+    else:
+        getattr(pdf, method)(**kwargs)
+
+
+def is_dynamic(block):
+    """
+    Blocks that draw the data of the participant
+    """
+    method, kwargs, fields = block
+    return fields or callable(method)
+
+
+#######################################
+# PRE-RENDERING
+#######################################
+# The pages of a layout are drawn once without the data of the participant, keeping the content of each page split
+# where the dynamic blocks go. A document is then composed by copying the static content and drawing only the
+# dynamic blocks (and the footer, that has the validation code) from the state the document had at each cut.
+# The blocks after a dynamic one must not depend on where it ended: they are either invisible or positioned
+# absolutely, which holds for the date and the name in the layouts above.
+DOCUMENT_STATE = ("x", "y", "lasth", "ws", "font_family", "font_style", "underline", "font_size_pt", "font_size",
+                  "unifontsubset", "text_color", "fill_color", "draw_color", "color_flag", "line_width",
+                  "l_margin", "t_margin", "r_margin", "c_margin", "b_margin", "auto_page_break", "page_break_trigger")
+
+
+class EmptyFields(dict):
+    def __missing__(self, key):
+        return ""
+
+
+def save_state(pdf):
+    state = {name: getattr(pdf, name) for name in DOCUMENT_STATE}
+    state["current_font"] = next((key for key, font in pdf.fonts.items() if font is pdf.current_font), None)
+    return state
+
+
+def restore_state(pdf, state):
+    for name in DOCUMENT_STATE:
+        setattr(pdf, name, state[name])
+    pdf.current_font = pdf.fonts[state["current_font"]] if state["current_font"] else {}
+
+
+def prerender_layout(pdf, layout):
+    """
+    Draws the static content of a layout
+    :param FPDF pdf: empty document of the class used to draw the layout
+    :param layout: layout compiled by compile_layout
+    :return: the fonts used and, for each page, its pieces of static content with the dynamic blocks between them
+    (together with the state of the document before each block) and the state of the document before the footer
+    """
+    pages = []
+
+    def record_page_end():
+        pages[-1]["footer_state"] = save_state(pdf)
+
+    pdf.footer = record_page_end
+    for block in layout["blocks"]:
+        while pdf.page > len(pages):
+            pages.append({"pieces": [], "dynamic": [], "start": 0})
+        if not is_dynamic(block):
+            draw_block(pdf, block, EmptyFields())
+            continue
+
+        page = pages[-1]
+        content = pdf.pages[pdf.page]
+        page["pieces"].append(content[page["start"]:])
+        page["dynamic"].append((block, save_state(pdf)))
+        draw_block(pdf, block, EmptyFields())
+        if pdf.page != len(pages):
+            raise ValueError("Dynamic blocks of a layout can't start a new page")
+        # The content drawn with the empty fields is discarded
+        pdf.pages[pdf.page] = content
+        page["start"] = len(content)
+
+    record_page_end()
+    for number, page in enumerate(pages, start=1):
+        page["pieces"].append(pdf.pages[number][page["start"]:])
+        del page["start"]
+
+    fonts = {key: dict(font) for key, font in pdf.fonts.items()}
+    return {"fonts": fonts, "pages": pages}
+
+
+def compose_layout(pdf, prerendered, context):
+    """
+    Draws a layout in the document from its static content, drawing only the blocks with the data of the participant
+    :param FPDF pdf: empty document of the same class used to pre-render the layout
+    :param prerendered: static content returned by prerender_layout
+    :param context: data of the participant that fills the fields of the layout
+    """
+    # The static content refers to the fonts by their number in the pre-rendered document
+    for key, font in prerendered["fonts"].items():
+        pdf.fonts[key] = dict(font, subset=list(font["subset"])) if "subset" in font else dict(font)
+
+    pdf.open()
+    pages = prerendered["pages"]
+    for number, page in enumerate(pages, start=1):
+        pdf._beginpage("")
+        pdf.pages[pdf.page] = page["pieces"][0]
+        for (block, state), piece in zip(page["dynamic"], page["pieces"][1:]):
+            restore_state(pdf, state)
+            draw_block(pdf, block, context)
+            pdf.pages[pdf.page] += piece
+        restore_state(pdf, page["footer_state"])
+        # The footer of the last page is drawn when the document is closed
+        if number < len(pages):
+            pdf.in_footer = 1
+            pdf.footer()
+            pdf.in_footer = 0
+            pdf._endpage()
@@ -0,0 +1,141 @@
+import ipaddress
+import socket
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+USER_AGENT = "WikiConecta link checker (https://wikiconecta.toolforge.org)"
+MAX_REDIRECTS = 10
+
+
+#######################################
+# LINK CHECKER
+#######################################
+class LinkCheckError(Exception):
+    """
+    The link could not be followed to a response
+    """
+
+
+class HostPoliteness:
+    """
+    Limits the requests sent to each host: at most `per_host` at a time, and each one at least `delay` seconds after
+    the previous one to the same host started, so a batch of links of the same wiki doesn't flood it
+    """
+    def __init__(self, per_host, delay):
+        self.per_host = per_host
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.semaphores = defaultdict(lambda: threading.BoundedSemaphore(self.per_host))
+        self.next_start = defaultdict(float)
+
+    def __call__(self, host):
+        with self.lock:
+            semaphore = self.semaphores[host]
+        return HostSlot(self, host, semaphore)
+
+    def wait_turn(self, host):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start[host])
+            self.next_start[host] = start + self.delay
+        if start > now:
+            time.sleep(start - now)
+
+
+class HostSlot:
+    def __init__(self, politeness, host, semaphore):
+        self.politeness = politeness
+        self.host = host
+        self.semaphore = semaphore
+
+    def __enter__(self):
+        self.semaphore.acquire()
+        self.politeness.wait_turn(self.host)
+
+    def __exit__(self, *exc_info):
+        self.semaphore.release()
+
+
+def check_address(url):
+    """
+    Refuses links to the addresses of the server's own network, unless LINK_CHECK_PRIVATE_ADDRESSES allows them
+    :raise LinkCheckError: if the host can't be resolved or is not public
+    """
+    host = urlsplit(url).hostname
+    if not host:
+        raise LinkCheckError("Invalid link")
+    if settings.LINK_CHECK_PRIVATE_ADDRESSES:
+        return
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except socket.gaierror as error:
+        raise LinkCheckError("Unknown host: {}".format(error))
+    for address in addresses:
+        if not ipaddress.ip_address(address.split("%")[0]).is_global:
+            raise LinkCheckError("The link points to a private address")
+
+
+def check_link(session, url, politeness, timeout):
+    """
+    Follows a link and its redirects. Every hop is checked and waits for its turn on its own host. The body of the
+    pages is not downloaded
+    :param session: requests.Session shared by the threads of the checker
+    :param url: link to be checked
+    :param politeness: HostPoliteness shared by the threads of the checker
+    :param timeout: seconds to wait for each response
+    :return: the status of the last response and the URL it came from
+    :raise LinkCheckError: if the link can't be followed to a response
+    """
+    for redirects in range(MAX_REDIRECTS + 1):
+        if urlsplit(url).scheme not in ("http", "https"):
+            raise LinkCheckError("Unsupported link")
+        check_address(url)
+        try:
+            with politeness(urlsplit(url).netloc.lower()):
+                # Many wikis answer HEAD with the same status as GET, but some servers don't implement it
+                response = session.head(url, allow_redirects=False, timeout=timeout)
+                if response.status_code in (405, 501):
+                    response.close()
+                    response = session.get(url, allow_redirects=False, timeout=timeout, stream=True)
+                response.close()
+        except requests.RequestException as error:
+            raise LinkCheckError(error.__class__.__name__)
+        if not response.is_redirect:
+            return response.status_code, url
+        url = urljoin(url, response.headers["Location"])
+    raise LinkCheckError("Too many redirects")
+
+
+def check_links(urls, workers=None, per_host=None, delay=None, timeout=None):
+    """
+    Checks many links concurrently. At most `workers` requests are sent at a time, and `per_host` to each host
+    :param urls: iterable of links
+    :return: generator of (url, status, final_url, error) in the order the links are given. The status and the final
+    URL are None when the link couldn't be followed, and the error describes why
+    """
+    workers = workers or settings.LINK_CHECK_WORKERS
+    politeness = HostPoliteness(per_host or settings.LINK_CHECK_PER_HOST,
+                                settings.LINK_CHECK_DELAY if delay is None else delay)
+    timeout = timeout or settings.LINK_CHECK_TIMEOUT
+
+    def check(url):
+        try:
+            status, final_url = check_link(session, url, politeness, timeout)
+        except LinkCheckError as error:
+            return url, None, None, str(error)
+        return url, status, final_url, ""
+
+    with requests.Session() as session:
+        session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_maxsize=workers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield from executor.map(check, urls)
@@ -0,0 +1,181 @@
+import json
+import multiprocessing
+import platform
+import resource
+import shutil
+import tempfile
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone, translation
+
+from user_profile.models import User
+from certificate.assets import preload_assets
+from certificate.views import generate_certificate, generate_enrollment_letter
+
+DOCUMENTS = {
+    "certificate": generate_certificate,
+    "enrollment": lambda user_id: generate_enrollment_letter(user_id).content,
+}
+# The long name is wider than the page, so the certificate abbreviates the middle names and shrinks the font
+NAMES = {
+    "short": ("Ana", "Lima"),
+    "long": ("Maria Aparecida Conceição", "dos Santos Oliveira Figueiredo de Albuquerque Cavalcanti Bittencourt Vasconcelos"),
+}
+LANGUAGES = ["pt-br", "en"]
+# cold: first document of a new process, that still has to parse the fonts and images
+# warm: fonts and images already loaded, but the document is not in the store of issued documents
+# stored: the document is read from the store of issued documents
+STATES = ["cold", "warm", "stored"]
+
+
+def percentile(samples, fraction):
+    """
+    Nearest-rank percentile of a list of samples
+    """
+    ordered = sorted(samples)
+    return ordered[max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))]
+
+
+def max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def benchmark_case(document, language, name, state, runs):
+    """
+    Times the generation of a document for a participant created only for the benchmark. The participant and their
+    documents are discarded at the end, and the store of issued documents is a temporary directory
+    :return: the latencies in seconds, the size of the PDF and the peak of memory allocated by Python (in KB)
+    """
+    generate = DOCUMENTS[document]
+    first_name, last_name = NAMES[name]
+    certificates_root = tempfile.mkdtemp(prefix="benchmark-")
+    try:
+        with override_settings(CERTIFICATES_ROOT=certificates_root), translation.override(language), transaction.atomic():
+            user = User.objects.create(username="benchmark-" + uuid.uuid4().hex, first_name=first_name,
+                                       last_name=last_name, email="benchmark@example.org")
+            if state == "stored":
+                generate(user.id)
+
+            latencies = []
+            for run in range(runs):
+                if state == "warm":
+                    shutil.rmtree(certificates_root)
+                start = time.perf_counter()
+                file = generate(user.id)
+                latencies.append(time.perf_counter() - start)
+
+            peak_python_kb = None
+            if state != "cold":
+                # Traced in a run of its own, as tracemalloc slows down the allocations
+                if state == "warm":
+                    shutil.rmtree(certificates_root)
+                tracemalloc.start()
+                generate(user.id)
+                peak_python_kb = tracemalloc.get_traced_memory()[1] // 1024
+                tracemalloc.stop()
+
+            transaction.set_rollback(True)
+    finally:
+        shutil.rmtree(certificates_root, ignore_errors=True)
+    return {"latencies": latencies, "pdf_bytes": len(file), "peak_python_kb": peak_python_kb, "max_rss_kb": max_rss_kb()}
+
+
+def benchmark_cold_case(document, language, name):
+    """
+    Times the first document of a new process. The process is spawned, not forked, so it inherits no fonts or
+    images. Django is set up before this module is imported there, as it imports the models
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"), initializer=django.setup) as executor:
+        return executor.submit(benchmark_case, document, language, name, "cold", 1).result()
+
+
+class Command(BaseCommand):
+    help = "Measures the latency, memory and size of the generated certificates and enrollment letters"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=20, help="Documents generated per case in the warm and stored states")
+        parser.add_argument("--cold-runs", type=int, default=1, help="New processes started per case in the cold state (0 skips it)")
+        parser.add_argument("--documents", nargs="+", choices=list(DOCUMENTS), default=list(DOCUMENTS))
+        parser.add_argument("--languages", nargs="+", default=LANGUAGES)
+        parser.add_argument("--names", nargs="+", choices=list(NAMES), default=list(NAMES))
+        parser.add_argument("--output", help="JSON file where the results are saved")
+        parser.add_argument("--baseline", help="JSON file saved by a previous run, to compare the results with")
+        parser.add_argument("--threshold", type=float, default=0.10, help="Relative increase reported as a regression")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["baseline"]:
+            try:
+                with open(options["baseline"]) as file:
+                    baseline = {self.key(case): case for case in json.load(file)["cases"]}
+            except (OSError, ValueError, KeyError) as error:
+                raise CommandError("Could not read the baseline {}: {}".format(options["baseline"], error))
+
+        cases = []
+        states = STATES if options["cold_runs"] else STATES[1:]
+        for state in states:
+            # The cold cases go first: the warm ones load the fonts and images in this process
+            if state == "warm":
+                preload_assets()
+            for document in options["documents"]:
+                for language in options["languages"]:
+                    for name in options["names"]:
+                        if state == "cold":
+                            results = [benchmark_cold_case(document, language, name) for run in range(options["cold_runs"])]
+                            result = {"latencies": [latency for item in results for latency in item["latencies"]],
+                                      "pdf_bytes": results[-1]["pdf_bytes"],
+                                      "peak_python_kb": None,
+                                      "max_rss_kb": max(item["max_rss_kb"] for item in results)}
+                        else:
+                            result = benchmark_case(document, language, name, state, options["runs"])
+                        case = self.summarize(document, language, name, state, result)
+                        cases.append(case)
+                        self.report(case, baseline, options["threshold"])
+
+        if options["output"]:
+            results = {"created_at": timezone.now().isoformat(),
+                       "python": platform.python_version(),
+                       "django": django.get_version(),
+                       "machine": platform.machine(),
+                       "cases": cases}
+            with open(options["output"], "w") as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write("Results saved in {}".format(options["output"]))
+
+    def key(self, case):
+        return case["document"], case["language"], case["name"], case["state"]
+
+    def summarize(self, document, language, name, state, result):
+        latencies = result["latencies"]
+        return {"document": document,
+                "language": language,
+                "name": name,
+                "state": state,
+                "runs": len(latencies),
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+                "p90_ms": round(percentile(latencies, 0.90) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+                "max_ms": round(max(latencies) * 1000, 2),
+                "pdf_bytes": result["pdf_bytes"],
+                "peak_python_kb": result["peak_python_kb"],
+                "max_rss_kb": result["max_rss_kb"]}
+
+    def report(self, case, baseline, threshold):
+        line = "{document:<11} {language:<5} {name:<5} {state:<6} p50 {p50_ms:>9.2f}ms  p90 {p90_ms:>9.2f}ms  p99 {p99_ms:>9.2f}ms  {pdf_bytes:>8} bytes".format(**case)
+        if case["peak_python_kb"] is not None:
+            line += "  peak {} KB".format(case["peak_python_kb"])
+        self.stdout.write(line)
+
+        previous = baseline.get(self.key(case)) if baseline else None
+        if not previous:
+            return
+        for field in ("p50_ms", "p90_ms", "pdf_bytes", "peak_python_kb"):
+            if previous.get(field) and case[field] is not None and case[field] > previous[field] * (1 + threshold):
+                self.stderr.write("    regression in {}: {} -> {}".format(field, previous[field], case[field]))
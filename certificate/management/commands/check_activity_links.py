@@ -0,0 +1,78 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from certificate.linkcheck import check_links
+from certificate.models import ActivityLink
+
+
+class Command(BaseCommand):
+    help = "Checks the activity links of the participants waiting for their certificate, saving the result of each one"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=settings.LINK_CHECK_WORKERS, help="Requests sent at a time")
+        parser.add_argument("--per-host", type=int, default=settings.LINK_CHECK_PER_HOST, help="Requests sent at a time to the same host")
+        parser.add_argument("--delay", type=float, default=settings.LINK_CHECK_DELAY, help="Seconds between the requests to the same host")
+        parser.add_argument("--timeout", type=float, default=settings.LINK_CHECK_TIMEOUT, help="Seconds to wait for each response")
+        parser.add_argument("--max-age", type=float, default=settings.LINK_CHECK_MAX_AGE, help="Hours after which a link is checked again")
+        parser.add_argument("--all", action="store_true", help="Check the links of every participant, not only of those waiting for their certificate")
+        parser.add_argument("--batch-size", type=int, default=200, help="Links saved at a time")
+        parser.add_argument("--loop", action="store_true", help="Keep checking new links instead of exiting")
+        parser.add_argument("--interval", type=int, default=300, help="Seconds between checks with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            checked, broken = self.check(options)
+            if checked:
+                self.stdout.write("{} links checked, {} broken".format(checked, broken))
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
+
+    def pending(self, options):
+        """
+        Links never checked or checked more than max-age hours ago
+        """
+        activity_links = ActivityLink.objects.filter(
+            Q(checked_at__isnull=True) | Q(checked_at__lt=timezone.now() - timedelta(hours=options["max_age"])))
+        if not options["all"]:
+            activity_links = activity_links.filter(user__requested_certificate=True)
+        return activity_links.only("id", "link").order_by("checked_at", "id")
+
+    def check(self, options):
+        """
+        Checks the pending links concurrently, saving the results in batches as they come
+        :return: the number of links checked and of broken links
+        """
+        activity_links = list(self.pending(options))
+        checked = broken = 0
+        batch = []
+        results = check_links((activity_link.link for activity_link in activity_links), workers=options["workers"],
+                              per_host=options["per_host"], delay=options["delay"], timeout=options["timeout"])
+        for activity_link, (url, status, final_url, error) in zip(activity_links, results):
+            activity_link.status_code = status
+            activity_link.final_url = final_url or ""
+            activity_link.check_error = error[:200]
+            activity_link.checked_at = timezone.now()
+            batch.append(activity_link)
+            checked += 1
+            if activity_link.is_broken:
+                broken += 1
+            if len(batch) >= options["batch_size"]:
+                self.save(batch)
+                batch = []
+        self.save(batch)
+        return checked, broken
+
+    def save(self, batch):
+        # A link changed by its participant while it was checked is checked again in the next run
+        with transaction.atomic():
+            for activity_link in batch:
+                ActivityLink.objects.filter(id=activity_link.id, link=activity_link.link).update(
+                    status_code=activity_link.status_code, final_url=activity_link.final_url,
+                    check_error=activity_link.check_error, checked_at=activity_link.checked_at)
@@ -0,0 +1,72 @@
+import math
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from certificate.assets import IMAGES, FLATTENED_IMAGES, DERIVED_IMAGES_DIR, asset_path, derived_image_path
+from certificate.layouts import LAYOUTS
+
+MM_PER_INCH = 25.4
+
+
+def printed_sizes():
+    """
+    Largest width and height, in millimeters, in which each image is printed by the layouts. A missing height
+    means the image keeps its proportion
+    """
+    sizes = {}
+    for layout in LAYOUTS.values():
+        for method, kwargs in layout["blocks"]:
+            if method != "image":
+                continue
+            width, height = sizes.get(kwargs["name"], (0, 0))
+            sizes[kwargs["name"]] = (max(width, kwargs.get("w") or 0), max(height, kwargs.get("h") or 0))
+    return sizes
+
+
+class Command(BaseCommand):
+    help = "Creates the copies of the images of the documents resized to the size in which they are printed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dpi", type=int, default=300, help="Resolution of the printed images")
+
+    def handle(self, *args, **options):
+        try:
+            from PIL import Image
+        except ImportError:
+            raise CommandError("Pillow is required to optimize the images: pip install Pillow")
+
+        os.makedirs(asset_path(DERIVED_IMAGES_DIR), exist_ok=True)
+        sizes = printed_sizes()
+        for name, relative_path in IMAGES.items():
+            if name not in sizes:
+                self.stdout.write("{}: not used by the layouts, skipped".format(name))
+                continue
+
+            original_path = asset_path(relative_path)
+            with Image.open(original_path) as original:
+                image = original.convert("RGBA")
+
+            width_mm, height_mm = sizes[name]
+            if not height_mm:
+                height_mm = width_mm * image.height / image.width
+            # The image is stretched to the printed box anyway, so each axis is resampled on its own, never enlarged
+            width = min(image.width, math.ceil(width_mm / MM_PER_INCH * options["dpi"]))
+            height = min(image.height, math.ceil(height_mm / MM_PER_INCH * options["dpi"]))
+            if (width, height) != image.size:
+                image = image.resize((width, height), Image.LANCZOS)
+
+            if name in FLATTENED_IMAGES:
+                # Drawn on the blank page, so the transparency is flattened on white
+                flattened = Image.new("RGB", image.size, (255, 255, 255))
+                flattened.paste(image, mask=image.getchannel("A"))
+                image = flattened
+            elif image.getchannel("A").getextrema() == (255, 255):
+                image = image.convert("RGB")
+
+            # Without transparency, fpdf embeds the compressed data of the PNG as it is, without decoding it
+            path = derived_image_path(name)
+            image.save(path, "PNG", optimize=True, dpi=(options["dpi"], options["dpi"]))
+
+            self.stdout.write("{name}: {original} -> {derived} bytes ({width}x{height} px)".format(
+                name=name, original=os.path.getsize(original_path), derived=os.path.getsize(path), width=width, height=height))
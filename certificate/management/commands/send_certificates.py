@@ -0,0 +1,99 @@
+import multiprocessing
+import time
+from concurrent.futures import as_completed
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone, translation
+
+from user_profile.models import User, Participant
+from certificate.rendering import render_document, render_pool
+from certificate.views import build_email_to_user, certificate_filename, enqueue_email, issue_certificate
+
+
+def parse_date(value):
+    try:
+        return timezone.make_aware(datetime.strptime(value, "%Y-%m-%d"))
+    except ValueError:
+        raise CommandError("Invalid date '{}', use the format YYYY-MM-DD".format(value))
+
+
+class Command(BaseCommand):
+    help = ("Renders the certificates of completion of a list of participants or of a cohort and queues their emails, "
+            "sent by the send_emails command")
+
+    def add_arguments(self, parser):
+        parser.add_argument("usernames", nargs="*", help="Usernames of the approved participants")
+        parser.add_argument("--enrolled-after", help="Participants enrolled at or after this date (YYYY-MM-DD)")
+        parser.add_argument("--enrolled-before", help="Participants enrolled before this date (YYYY-MM-DD)")
+        parser.add_argument("--year", type=int, help="Participants enrolled in this year")
+        parser.add_argument("--language", default=settings.LANGUAGE_CODE, choices=[code for code, name in settings.LANGUAGES])
+        parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), help="Number of render processes")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Render the certificates without queueing the emails. The certificates are still issued, "
+                                 "so the participants keep the same validation code when they are sent")
+
+    def get_users(self, options):
+        if options["usernames"]:
+            users = User.objects.filter(username__in=options["usernames"])
+            missing = set(options["usernames"]) - set(users.values_list("username", flat=True))
+            for username in sorted(missing):
+                self.stderr.write("{}: user not found".format(username))
+            return users
+
+        participants = Participant.objects.filter(enrolled_at__isnull=False)
+        if options["year"]:
+            participants = participants.filter(enrolled_at__year=options["year"])
+        if options["enrolled_after"]:
+            participants = participants.filter(enrolled_at__gte=parse_date(options["enrolled_after"]))
+        if options["enrolled_before"]:
+            participants = participants.filter(enrolled_at__lt=parse_date(options["enrolled_before"]))
+        if not (options["year"] or options["enrolled_after"] or options["enrolled_before"]):
+            raise CommandError("Inform the usernames or filter the cohort by --year, --enrolled-after or --enrolled-before")
+
+        # In a cohort, only the participants that requested the certificate are considered
+        return User.objects.filter(requested_certificate=True,
+                                   username__in=participants.values("username"))
+
+    def handle(self, *args, **options):
+        users = {user.id: user for user in self.get_users(options)}
+        if not users:
+            self.stdout.write("No participants to send certificates to")
+            return
+        certificates = {certificate_obj.id: certificate_obj
+                        for certificate_obj in (issue_certificate(user, "certificate") for user in users.values())}
+
+        start = time.monotonic()
+        executor = render_pool(options["workers"])
+        self.stdout.write("Fonts and images loaded in {:.1f}s".format(time.monotonic() - start))
+
+        failures = {}
+        done = 0
+        start = time.monotonic()
+
+        with executor:
+            # The certificates are left in the store, so the mail worker attaches them without rendering them again
+            jobs = {executor.submit(render_document, certificate_id, options["language"]): certificate_id
+                    for certificate_id in certificates}
+            for job in as_completed(jobs):
+                certificate_obj = certificates[jobs[job]]
+                user = users[certificate_obj.user_id]
+                try:
+                    job.result()
+                    if not options["dry_run"]:
+                        with translation.override(options["language"]):
+                            enqueue_email(build_email_to_user([], user), certificate=certificate_obj,
+                                          attachment_name=certificate_filename(user.username))
+                except Exception as error:
+                    failures[user.username] = error
+                    self.stderr.write("{}: {}".format(user.username, error))
+                else:
+                    done += 1
+                    self.stdout.write("{}: {}".format(user.username, "rendered" if options["dry_run"] else "queued"))
+
+        elapsed = time.monotonic() - start
+        self.stdout.write("{done} certificates in {elapsed:.1f}s ({rate:.2f}/s), {failed} failures".format(
+            done=done, elapsed=elapsed, rate=done / elapsed if elapsed else 0, failed=len(failures)))
+        if failures:
+            self.stderr.write("Failed: " + ", ".join(sorted(failures)))
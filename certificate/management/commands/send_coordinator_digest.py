@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from user_profile.models import User
+from certificate.models import CoordinatorDigest, CoordinatorDigestEntry
+from certificate.views import send_digest_to_coordinator
+
+# The date of a request is set before it is saved, so a request may be committed after a summary that ends after its
+# date. The requests of this period before the end of the last summary are looked at again, skipping the ones included
+OVERLAP = timedelta(hours=1)
+
+
+class Command(BaseCommand):
+    help = "Queues to the coordinators a summary of the certificate requests received since the last summary"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            # Every run locks the first summary, created by a migration, so two runs never make a summary at the same time
+            CoordinatorDigest.objects.select_for_update().order_by("id").first()
+            last_digest = CoordinatorDigest.objects.order_by("-requests_until").first()
+            until = timezone.now()
+
+            included = CoordinatorDigestEntry.objects.filter(user=OuterRef("pk"), date_of_request=OuterRef("date_of_request"))
+            requests = (User.objects.filter(requested_certificate=True, date_of_request__lte=until)
+                        .exclude(Exists(included)))
+            if last_digest:
+                requests = requests.filter(date_of_request__gt=last_digest.requests_until - OVERLAP)
+            users = list(requests.only("username", "first_name", "last_name", "date_of_request").order_by("date_of_request"))
+
+            if not users:
+                self.stdout.write("No new certificate requests")
+                return
+
+            send_digest_to_coordinator(users)
+            digest = CoordinatorDigest.objects.create(requests_until=until, number_of_requests=len(users))
+            CoordinatorDigestEntry.objects.bulk_create([
+                CoordinatorDigestEntry(digest=digest, user=user, date_of_request=user.date_of_request) for user in users])
+        self.stdout.write("Summary of {} certificate requests queued".format(len(users)))
@@ -0,0 +1,172 @@
+import time
+from concurrent.futures import as_completed
+from datetime import timedelta
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from certificate.models import OutboxEmail
+from certificate.rendering import render_pool, render_document
+from certificate.storage import get_document, printed_name
+from certificate.views import build_outbox_message
+
+MAX_ATTEMPTS = 6
+BACKOFF_SECONDS = 60
+MAX_BACKOFF_SECONDS = 6 * 60 * 60
+LEASE = timedelta(minutes=15)
+MAX_OUTAGE_WAIT_SECONDS = 30 * 60
+
+
+class MailServerUnavailable(Exception):
+    """
+    The connection to the mail server could not be opened
+    """
+
+
+def backoff(attempts):
+    """
+    Time to wait before the next attempt, doubling after each failure
+    """
+    return timedelta(seconds=min(BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS))
+
+
+class Command(BaseCommand):
+    help = "Sends the emails waiting in the outbox through a single SMTP connection"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50, help="Emails taken from the outbox at a time")
+        parser.add_argument("--loop", action="store_true", help="Keep waiting for new emails instead of exiting")
+        parser.add_argument("--interval", type=int, default=30, help="Seconds between checks of the outbox with --loop")
+        parser.add_argument("--workers", type=int, default=4, help="Processes rendering the attached documents")
+
+    def handle(self, *args, **options):
+        outages = 0
+        while True:
+            try:
+                sent, failed = self.drain(options["batch_size"], options["workers"])
+            except MailServerUnavailable as error:
+                if not options["loop"]:
+                    raise CommandError(str(error))
+                # The worker keeps running through an outage of the mail server, waiting longer after each attempt
+                outages += 1
+                wait = min(max(1, options["interval"]) * 2 ** (outages - 1), MAX_OUTAGE_WAIT_SECONDS)
+                self.stderr.write("{}. Trying again in {} seconds".format(error, wait))
+                time.sleep(wait)
+                continue
+
+            outages = 0
+            if sent or failed:
+                self.stdout.write("{} emails sent, {} failed".format(sent, failed))
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
+
+    def drain(self, batch_size, workers):
+        """
+        Sends every email due in the outbox
+        :return: the number of emails sent and of failed attempts
+        :raise MailServerUnavailable: if the mail server can't be reached. The emails claimed and not sent yet are
+        released, so they are taken again as soon as it can
+        """
+        sent = failed = 0
+        connection = None
+        try:
+            while True:
+                batch = self.claim(batch_size)
+                if not batch:
+                    return sent, failed
+
+                self.render_attachments(batch, workers)
+
+                pending = list(batch)
+                try:
+                    if connection is None:
+                        connection = get_connection()
+                        self.open(connection)
+
+                    while pending:
+                        outbox_email = pending.pop(0)
+                        if self.deliver(outbox_email, connection):
+                            sent += 1
+                        else:
+                            failed += 1
+                            # The server may have dropped the connection, so it is opened again for the next email
+                            connection.close()
+                            self.open(connection)
+                except MailServerUnavailable:
+                    self.release(pending)
+                    raise
+        finally:
+            if connection is not None:
+                connection.close()
+
+    def claim(self, batch_size):
+        """
+        Takes the next emails due in the outbox, postponing them by LEASE so other workers skip them while they
+        are sent. If this worker stops before sending them, they are taken again when the lease expires
+        """
+        with transaction.atomic():
+            ids = list(OutboxEmail.objects.select_for_update(skip_locked=True)
+                       .filter(status="pending", next_attempt_at__lte=timezone.now())
+                       .order_by("next_attempt_at")
+                       .values_list("id", flat=True)[:batch_size])
+            OutboxEmail.objects.filter(id__in=ids).update(next_attempt_at=timezone.now() + LEASE)
+        return list(OutboxEmail.objects.select_related("certificate__user").filter(id__in=ids).order_by("id"))
+
+    def render_attachments(self, batch, workers):
+        """
+        Renders in parallel the attached documents that are not in the store yet, so the emails of a batch don't
+        wait for each other's documents. A document that fails here is tried again when its email is sent
+        """
+        pending = set()
+        for outbox_email in batch:
+            certificate_obj = outbox_email.certificate
+            if certificate_obj and get_document(certificate_obj.certificate_hash, outbox_email.language, printed_name(certificate_obj.user)) is None:
+                pending.add((certificate_obj.id, outbox_email.language))
+        if len(pending) < 2 or workers < 2:
+            return
+
+        with render_pool(min(workers, len(pending))) as executor:
+            jobs = [executor.submit(render_document, certificate_id, language) for certificate_id, language in pending]
+            for job in as_completed(jobs):
+                try:
+                    job.result()
+                except Exception as error:
+                    self.stderr.write("Rendering of an attachment failed: {}".format(error))
+
+    def open(self, connection):
+        try:
+            connection.open()
+        except Exception as error:
+            raise MailServerUnavailable("Could not connect to the mail server: {}".format(error))
+
+    def release(self, outbox_emails):
+        """
+        Makes claimed emails due again, instead of waiting for their lease to expire
+        """
+        OutboxEmail.objects.filter(id__in=[outbox_email.id for outbox_email in outbox_emails], status="pending").update(
+            next_attempt_at=timezone.now())
+
+    def deliver(self, outbox_email, connection):
+        outbox_email.attempts += 1
+        try:
+            message = build_outbox_message(outbox_email)
+            message.connection = connection
+            message.send()
+        except Exception as error:
+            outbox_email.last_error = str(error)
+            if outbox_email.attempts >= MAX_ATTEMPTS:
+                outbox_email.status = "failed"
+            else:
+                outbox_email.next_attempt_at = timezone.now() + backoff(outbox_email.attempts)
+            outbox_email.save()
+            self.stderr.write("Email {} to {}: {}".format(outbox_email.id, ", ".join(outbox_email.to), error))
+            return False
+
+        outbox_email.status = "sent"
+        outbox_email.sent_at = timezone.now()
+        outbox_email.last_error = ""
+        outbox_email.save()
+        return True
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certificate', '0003_alter_certificate_user'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='certificate',
+            name='certificate_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
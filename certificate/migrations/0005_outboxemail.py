@@ -0,0 +1,38 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certificate', '0004_alter_certificate_certificate_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255, verbose_name='Subject')),
+                ('body', models.TextField(verbose_name='Body')),
+                ('from_email', models.CharField(max_length=254, verbose_name='From')),
+                ('to', models.JSONField(default=list, verbose_name='To')),
+                ('bcc', models.JSONField(blank=True, default=list, verbose_name='Bcc')),
+                ('attachment_name', models.CharField(blank=True, max_length=255, verbose_name='Attachment name')),
+                ('language', models.CharField(blank=True, max_length=7, verbose_name='Language')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=7, verbose_name='Status')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Attempts')),
+                ('last_error', models.TextField(blank=True, verbose_name='Last error')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('certificate', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='outbox_emails', to='certificate.certificate')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='certificate_status_6c545e_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.14 on 2026-10-18 13:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certificate', '0005_outboxemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoordinatorDigest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('requests_until', models.DateTimeField(verbose_name='Requests until')),
+                ('number_of_requests', models.IntegerField(default=0, verbose_name='Number of requests')),
+            ],
+        ),
+    ]
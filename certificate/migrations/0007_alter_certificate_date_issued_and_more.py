@@ -0,0 +1,53 @@
+# Generated by Django 4.2.14 on 2026-10-18 13:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def remove_duplicated_certificates(apps, schema_editor):
+    """
+    Keeps the first document issued of each type to each participant. The emails of the duplicates are moved to it,
+    and their validation codes become aliases of it, so the documents already sent keep validating
+    """
+    Certificate = apps.get_model("certificate", "Certificate")
+    CertificateCodeAlias = apps.get_model("certificate", "CertificateCodeAlias")
+    OutboxEmail = apps.get_model("certificate", "OutboxEmail")
+    duplicated = (Certificate.objects.values("user_id", "certificate_type")
+                  .annotate(count=models.Count("id"), first_id=models.Min("id"))
+                  .filter(count__gt=1))
+    for group in duplicated:
+        duplicates = Certificate.objects.filter(user_id=group["user_id"], certificate_type=group["certificate_type"]).exclude(id=group["first_id"])
+        OutboxEmail.objects.filter(certificate__in=duplicates).update(certificate_id=group["first_id"])
+        codes = duplicates.exclude(certificate_hash__isnull=True).exclude(certificate_hash="").values_list("certificate_hash", flat=True)
+        CertificateCodeAlias.objects.bulk_create([CertificateCodeAlias(code=code, certificate_id=group["first_id"]) for code in codes])
+        duplicates.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certificate', '0006_coordinatordigest'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='certificate',
+            name='date_issued',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.CreateModel(
+            name='CertificateCodeAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=64, unique=True, verbose_name='Validation code')),
+                ('certificate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='code_aliases', to='certificate.certificate')),
+            ],
+        ),
+        migrations.RunPython(remove_duplicated_certificates, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='certificate',
+            unique_together={('user', 'certificate_type')},
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.14 on 2026-10-18 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certificate', '0007_alter_certificate_date_issued_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activitylink',
+            name='check_error',
+            field=models.CharField(blank=True, max_length=200, verbose_name='Error checking the link'),
+        ),
+        migrations.AddField(
+            model_name='activitylink',
+            name='checked_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Link checked at'),
+        ),
+        migrations.AddField(
+            model_name='activitylink',
+            name='final_url',
+            field=models.URLField(blank=True, max_length=2000, verbose_name='Final address of the link'),
+        ),
+        migrations.AddField(
+            model_name='activitylink',
+            name='status_code',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Status of the link'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.14 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certificate', '0008_activitylink_check'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activitylink',
+            name='page_title',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Page title'),
+        ),
+        migrations.AddField(
+            model_name='activitylink',
+            name='revision_fetched_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Edit looked up at'),
+        ),
+        migrations.AddField(
+            model_name='activitylink',
+            name='revision_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Revision id'),
+        ),
+        migrations.AddField(
+            model_name='activitylink',
+            name='revision_size_delta',
+            field=models.IntegerField(blank=True, null=True, verbose_name='Size change of the edit'),
+        ),
+        migrations.AddField(
+            model_name='activitylink',
+            name='revision_timestamp',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Time of the edit'),
+        ),
+        migrations.AddField(
+            model_name='activitylink',
+            name='revision_user',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Author of the edit'),
+        ),
+    ]
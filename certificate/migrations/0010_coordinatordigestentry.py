@@ -0,0 +1,41 @@
+# Generated by Django 4.2.14 on 2026-10-18 13:50
+
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_first_digest(apps, schema_editor):
+    """
+    The first summary, of the requests before 2000, is the row locked by send_coordinator_digest, so two runs never
+    make a summary at the same time, even before the first one is sent
+    """
+    CoordinatorDigest = apps.get_model("certificate", "CoordinatorDigest")
+    if not CoordinatorDigest.objects.exists():
+        CoordinatorDigest.objects.create(requests_until=datetime(2000, 1, 1, tzinfo=timezone.utc), number_of_requests=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certificate', '0009_activitylink_revision'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoordinatorDigestEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_of_request', models.DateTimeField()),
+                ('digest', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='certificate.coordinatordigest')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='digest_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'date_of_request')},
+            },
+        ),
+        migrations.RunPython(create_first_digest, migrations.RunPython.noop),
+    ]
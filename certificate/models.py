@@ -1,6 +1,8 @@
 import hashlib
 
+from django.core.cache import cache
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from user_profile.models import User
 
@@ -13,14 +15,49 @@ class CourseModule(models.Model):
         return self.name
 
 
+ACTIVITY_MODULES_CACHE_KEY = "certificate:activity_modules"
+
+
+def activity_module_ids():
+    """
+    Ids of the modules with an activity to be submitted, in the order of the course. The first module has no
+    activity. The list is cached and discarded whenever a module changes
+    """
+    module_ids = cache.get(ACTIVITY_MODULES_CACHE_KEY)
+    if module_ids is None:
+        module_ids = list(CourseModule.objects.order_by("order", "id").values_list("id", flat=True)[1:])
+        cache.set(ACTIVITY_MODULES_CACHE_KEY, module_ids, None)
+    return module_ids
+
+
 class ActivityLink(models.Model):
     link = models.URLField(_("Activity link"))
     module = models.ForeignKey(CourseModule, on_delete=models.RESTRICT, related_name="activity_link")
     user = models.ForeignKey(User, on_delete=models.RESTRICT, related_name="user_activity")
+    # Result of the last check of the link by the check_activity_links command
+    status_code = models.PositiveSmallIntegerField(_("Status of the link"), null=True, blank=True)
+    final_url = models.URLField(_("Final address of the link"), max_length=2000, blank=True)
+    check_error = models.CharField(_("Error checking the link"), max_length=200, blank=True)
+    checked_at = models.DateTimeField(_("Link checked at"), null=True, blank=True)
+    # Edit the link points to, looked up in the API of its wiki from the review page
+    revision_id = models.PositiveBigIntegerField(_("Revision id"), null=True, blank=True)
+    page_title = models.CharField(_("Page title"), max_length=255, blank=True)
+    revision_user = models.CharField(_("Author of the edit"), max_length=255, blank=True)
+    revision_size_delta = models.IntegerField(_("Size change of the edit"), null=True, blank=True)
+    revision_timestamp = models.DateTimeField(_("Time of the edit"), null=True, blank=True)
+    revision_fetched_at = models.DateTimeField(_("Edit looked up at"), null=True, blank=True)
 
     class Meta:
         unique_together = ('module', 'user')
 
+    @property
+    def is_broken(self):
+        return self.checked_at is not None and not (self.status_code and self.status_code < 400)
+
+    @property
+    def is_redirected(self):
+        return bool(self.final_url) and self.final_url != self.link
+
     def __str__(self):
         return _("Activity %(order)s of %(user)s") % {"order": self.module.order, "user": str(self.user)}
 
@@ -31,9 +68,74 @@ class Certificate(models.Model):
         ("certificate", _("Certificate"))
     )
     user = models.ForeignKey(User, on_delete=models.RESTRICT, related_name="user_certificate")
-    date_issued = models.DateTimeField(auto_now=True)
-    certificate_hash = models.CharField(max_length=64, blank=True, null=True)
+    date_issued = models.DateTimeField(auto_now_add=True)
+    certificate_hash = models.CharField(max_length=64, blank=True, null=True, unique=True)
     certificate_type = models.CharField(max_length=12, choices=CHOICES)
 
+    class Meta:
+        unique_together = ('user', 'certificate_type')
+
     def __str__(self):
-        return "(" + self.certificate_type + ") " + self.user.username + " - " + self.date_issued.strftime("%Y-%m-%d %H:%M:%S")
\ No newline at end of file
+        return "(" + self.certificate_type + ") " + self.user.username + " - " + self.date_issued.strftime("%Y-%m-%d %H:%M:%S")
+
+
+class CertificateCodeAlias(models.Model):
+    """
+    Validation code of a duplicated document that was merged into another one of the same participant and type.
+    The code is printed on documents already sent, so it keeps validating the document that remained
+    """
+    code = models.CharField(_("Validation code"), max_length=64, unique=True)
+    certificate = models.ForeignKey(Certificate, on_delete=models.CASCADE, related_name="code_aliases")
+
+    def __str__(self):
+        return self.code
+
+
+class OutboxEmail(models.Model):
+    STATUS = (
+        ("pending", _("Pending")),
+        ("sent", _("Sent")),
+        ("failed", _("Failed")),
+    )
+    subject = models.CharField(_("Subject"), max_length=255)
+    body = models.TextField(_("Body"))
+    from_email = models.CharField(_("From"), max_length=254)
+    to = models.JSONField(_("To"), default=list)
+    bcc = models.JSONField(_("Bcc"), default=list, blank=True)
+    certificate = models.ForeignKey(Certificate, on_delete=models.CASCADE, null=True, blank=True, related_name="outbox_emails")
+    attachment_name = models.CharField(_("Attachment name"), max_length=255, blank=True)
+    language = models.CharField(_("Language"), max_length=7, blank=True)
+    status = models.CharField(_("Status"), max_length=7, choices=STATUS, default="pending")
+    attempts = models.IntegerField(_("Attempts"), default=0)
+    last_error = models.TextField(_("Last error"), blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+    def __str__(self):
+        return "(" + self.status + ") " + self.subject + " - " + ", ".join(self.to)
+
+
+class CoordinatorDigest(models.Model):
+    created_at = models.DateTimeField(auto_now_add=True)
+    requests_until = models.DateTimeField(_("Requests until"))
+    number_of_requests = models.IntegerField(_("Number of requests"), default=0)
+
+    def __str__(self):
+        return self.requests_until.strftime("%Y-%m-%d %H:%M:%S") + " (" + str(self.number_of_requests) + ")"
+
+
+class CoordinatorDigestEntry(models.Model):
+    """
+    Certificate request included in a summary to the coordinators. A participant that requests the certificate
+    again has a new date of request, that goes in a later summary
+    """
+    digest = models.ForeignKey(CoordinatorDigest, on_delete=models.CASCADE, related_name="entries")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="digest_entries")
+    date_of_request = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'date_of_request')
@@ -0,0 +1,188 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.utils import translation
+
+from certificate.assets import preload_assets
+
+logger = logging.getLogger(__name__)
+
+
+#######################################
+# RENDER POOL
+#######################################
+# The models and views are imported inside the functions, since the processes of the online pool import this
+# module before Django is set up
+def start_worker():
+    """
+    Every render process opens its own database connection
+    """
+    connections.close_all()
+
+
+def render_pool(workers):
+    """
+    Process pool to render documents in parallel. The pool forks this process: the fonts and images parsed before
+    are inherited by the render processes, but the open database connection can't be shared with them
+    :param workers: number of render processes
+    :return: the ProcessPoolExecutor, to be used as a context manager
+    """
+    preload_assets()
+    connections.close_all()
+    return ProcessPoolExecutor(max_workers=max(1, workers),
+                               mp_context=multiprocessing.get_context("fork"),
+                               initializer=start_worker)
+
+
+def render_document(certificate_id, language):
+    """
+    Renders an issued document in a process of the pool, leaving it in the store of issued documents
+    :param certificate_id: id of the Certificate
+    :param language: language of the document
+    :return: the id of the Certificate
+    """
+    from certificate.models import Certificate
+    from certificate.views import render_issued_document
+
+    certificate_obj = Certificate.objects.select_related("user").get(pk=certificate_id)
+    with translation.override(language):
+        render_issued_document(certificate_obj)
+    return certificate_id
+
+
+#######################################
+# ONLINE RENDER POOL
+#######################################
+class RenderPoolSaturated(Exception):
+    """
+    The online pool has no room for another document, or the document took longer than RENDER_TIMEOUT
+    """
+
+
+class OnlineRenderPool:
+    """
+    Renders the documents requested by the web workers in a few separate processes, so a burst of downloads doesn't
+    hold every web worker. At most RENDER_WORKERS documents are rendered at a time and RENDER_QUEUE_SIZE wait for
+    a process, further requests are refused right away. The processes are spawned, as forking a web worker that
+    may be running other threads is not safe
+    """
+    def __init__(self, workers, queue_size, timeout):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.executor = None
+        self.in_flight = 0
+        self.counters = {"completed": 0, "failed": 0, "rejected": 0, "timed_out": 0}
+
+    def get_executor(self):
+        if self.executor is None:
+            context = multiprocessing.get_context("spawn")
+            if settings.RENDER_PYTHON:
+                # Application servers like uWSGI are not a Python interpreter that can start the processes
+                context.set_executable(settings.RENDER_PYTHON)
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=start_online_worker)
+        return self.executor
+
+    def render(self, certificate_id, language, on_done=None):
+        """
+        Renders an issued document in a process of the pool, waiting at most RENDER_TIMEOUT seconds for it
+        :param on_done: function called without arguments when the process is done with the document, or right away
+        if the document is refused
+        :return: the bytes of the PDF
+        :raise RenderPoolSaturated: if the pool is full or the document is not ready in time
+        """
+        with self.lock:
+            if self.in_flight >= self.capacity:
+                self.counters["rejected"] += 1
+                if on_done:
+                    on_done()
+                raise RenderPoolSaturated("The render pool is full")
+            self.in_flight += 1
+            try:
+                job = self.get_executor().submit(render_online_document, certificate_id, language)
+            except BrokenProcessPool:
+                self.in_flight -= 1
+                self.executor = None
+                if on_done:
+                    on_done()
+                raise
+        # The slot is released when the document is ready, even if the request stopped waiting for it
+        job.add_done_callback(self.finish)
+        if on_done:
+            job.add_done_callback(lambda job: on_done())
+
+        try:
+            return job.result(timeout=self.timeout)
+        except TimeoutError:
+            with self.lock:
+                self.counters["timed_out"] += 1
+            logger.warning("Rendering of document %s took more than %s seconds", certificate_id, self.timeout)
+            raise RenderPoolSaturated("The document took too long to be rendered")
+        except BrokenProcessPool:
+            with self.lock:
+                self.executor = None
+            raise
+
+    def finish(self, job):
+        with self.lock:
+            self.in_flight -= 1
+            if job.cancelled() or job.exception() is not None:
+                self.counters["failed"] += 1
+            else:
+                self.counters["completed"] += 1
+
+    def stats(self):
+        """
+        Occupation of the pool of this web worker: documents being rendered, documents waiting for a process and
+        the totals since the worker started
+        """
+        with self.lock:
+            return dict(self.counters,
+                        workers=self.workers,
+                        capacity=self.capacity,
+                        rendering=min(self.in_flight, self.workers),
+                        queued=max(0, self.in_flight - self.workers))
+
+
+def start_online_worker():
+    django.setup()
+    preload_assets()
+
+
+def render_online_document(certificate_id, language):
+    """
+    Reads or renders an issued document in a process of the online pool
+    :return: the bytes of the PDF
+    """
+    from certificate.models import Certificate
+    from certificate.views import render_issued_document
+
+    close_old_connections()
+    certificate_obj = Certificate.objects.select_related("user").get(pk=certificate_id)
+    with translation.override(language):
+        return render_issued_document(certificate_obj)
+
+
+_online_pool = None
+_online_pool_lock = threading.Lock()
+
+
+def online_render_pool():
+    """
+    Pool of this web worker, started with the first document that is not in the store. None when RENDER_WORKERS
+    is 0, so the documents are rendered by the web worker itself
+    """
+    global _online_pool
+    if not settings.RENDER_WORKERS:
+        return None
+    with _online_pool_lock:
+        if _online_pool is None:
+            _online_pool = OnlineRenderPool(settings.RENDER_WORKERS, settings.RENDER_QUEUE_SIZE, settings.RENDER_TIMEOUT)
+        return _online_pool
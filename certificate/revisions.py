@@ -0,0 +1,104 @@
+import logging
+import re
+from collections import defaultdict
+from datetime import datetime
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from django.utils import timezone
+
+from certificate.models import ActivityLink
+from education_program.wiki import get_revisions
+
+logger = logging.getLogger(__name__)
+
+WIKIMEDIA_DOMAINS = ("wikipedia.org", "wikiversity.org", "wikimedia.org", "wikidata.org", "wikibooks.org",
+                     "wikisource.org", "wikiquote.org", "wiktionary.org", "wikinews.org", "wikivoyage.org",
+                     "mediawiki.org")
+# Special:Diff/123, Special:Diff/122/123, Special:PermanentLink/123, in any language of the wikis
+SPECIAL_REVISION = re.compile(r"^[^:]+:(?:Diff|PermanentLink|Ligação[_ ]permanente)/(?:\d+/)?(\d+)$", re.IGNORECASE)
+
+
+#######################################
+# REVISIONS OF THE ACTIVITIES
+#######################################
+def parse_activity_link(link):
+    """
+    Finds the edit a link of an activity points to
+    :param link: address of a diff, of a permanent link or of a page of a Wikimedia wiki
+    :return: (address of the API of the wiki, revision id, page title), where either the revision id or the title
+    is None, or None if the link is not to a Wikimedia wiki
+    """
+    parts = urlsplit(link)
+    host = (parts.hostname or "").lower()
+    if parts.scheme not in ("http", "https") or not any(host == domain or host.endswith("." + domain) for domain in WIKIMEDIA_DOMAINS):
+        return None
+    api_url = "https://{}/w/api.php".format(host.replace(".m.", "."))
+
+    query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+    diff = query.get("diff", "")
+    oldid = query.get("oldid", "")
+    if diff.isdigit():
+        return api_url, int(diff), None
+    if oldid.isdigit() and diff in ("", "prev"):
+        return api_url, int(oldid), None
+    if diff or oldid:
+        # Diffs to the next or to the current revision don't point to a single edit
+        return None
+
+    if parts.path.startswith("/wiki/"):
+        title = unquote(parts.path[len("/wiki/"):])
+    else:
+        title = query.get("title", "")
+    if not title:
+        return None
+    match = SPECIAL_REVISION.match(title)
+    if match:
+        return api_url, int(match.group(1)), None
+    return api_url, None, title.replace("_", " ")
+
+
+def fetch_revisions(request, activity_links):
+    """
+    Saves the author, the size change and the time of the edit of each link of activity not looked up yet. The links
+    of each wiki are looked up together, many revisions per query to the API
+    :param request: request of a user logged in with their Wikimedia account
+    :param activity_links: ActivityLink objects, that are updated in place
+    :return: the number of links whose edit was found
+    """
+    wanted = defaultdict(list)
+    looked_up = []
+    for activity_link in activity_links:
+        if activity_link.revision_fetched_at is None:
+            target = parse_activity_link(activity_link.link)
+            if target:
+                wanted[target[0]].append((activity_link, target[1], target[2]))
+            else:
+                activity_link.revision_fetched_at = timezone.now()
+                looked_up.append(activity_link)
+
+    found = 0
+    for api_url, links in wanted.items():
+        try:
+            by_revid, by_title = get_revisions(request, api_url,
+                                               revids=[revid for link, revid, title in links if revid],
+                                               titles=[title for link, revid, title in links if title])
+        except Exception as error:
+            # The links of this wiki are looked up again the next time
+            logger.warning("Could not fetch the revisions of %s: %s", api_url, error)
+            continue
+
+        for activity_link, revid, title in links:
+            revision = by_revid.get(revid) if revid else by_title.get(title)
+            if revision:
+                activity_link.revision_id = revision["revid"]
+                activity_link.page_title = revision["title"]
+                activity_link.revision_user = revision.get("user", "")
+                activity_link.revision_size_delta = revision["size_delta"]
+                activity_link.revision_timestamp = datetime.fromisoformat(revision["timestamp"].replace("Z", "+00:00"))
+                found += 1
+            activity_link.revision_fetched_at = timezone.now()
+            looked_up.append(activity_link)
+
+    ActivityLink.objects.bulk_update(looked_up, ["revision_id", "page_title", "revision_user", "revision_size_delta",
+                                                 "revision_timestamp", "revision_fetched_at"], batch_size=100)
+    return found
@@ -0,0 +1,27 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from user_profile.models import UserModification
+from certificate.models import Certificate, CourseModule, ACTIVITY_MODULES_CACHE_KEY
+from certificate.storage import delete_documents
+
+
+@receiver(post_save, sender=UserModification)
+def delete_documents_with_old_name(sender, instance, created, **kwargs):
+    """
+    The stored documents print the name of the participant, so the ones with the old name are discarded when the
+    name changes. They are not served anyway, since the name is part of their path in the store
+    """
+    if instance.old_first_name == instance.new_first_name and instance.old_last_name == instance.new_last_name:
+        return
+
+    certificate_hashes = Certificate.objects.filter(user=instance.user, certificate_hash__isnull=False).exclude(certificate_hash="").values_list("certificate_hash", flat=True)
+    for certificate_hash in certificate_hashes:
+        delete_documents(certificate_hash)
+
+
+@receiver(post_save, sender=CourseModule)
+@receiver(post_delete, sender=CourseModule)
+def forget_activity_modules(sender, **kwargs):
+    cache.delete(ACTIVITY_MODULES_CACHE_KEY)
@@ -0,0 +1,93 @@
+import glob
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.utils.http import quote_etag
+
+
+#######################################
+# ISSUED DOCUMENTS STORE
+#######################################
+# Increase this number whenever the layout of the documents changes, so the stored files are rendered again
+LAYOUT_VERSION = 2
+
+
+def document_dir(certificate_hash):
+    return os.path.join(settings.CERTIFICATES_ROOT, certificate_hash[:2])
+
+
+def printed_name(user):
+    """
+    Full name of the participant, as printed in their documents
+    """
+    return user.first_name + " " + user.last_name
+
+
+def document_path(certificate_hash, language, name, layout_version=LAYOUT_VERSION):
+    """
+    Path of an issued document in the store. The path changes with the name printed in the document, so a document
+    with an old name is never served, however the name was changed
+    :param certificate_hash: validation code of the document
+    :param language: language in which the document was rendered
+    :param name: full name of the participant printed in the document
+    :param layout_version: version of the layout used to render the document
+    :return: absolute path of the file
+    """
+    name_hash = hashlib.sha1(name.encode("utf-8")).hexdigest()[:12]
+    filename = "{hash}-{language}-v{version}-{name}.pdf".format(hash=certificate_hash, language=language,
+                                                             version=layout_version, name=name_hash)
+    return os.path.join(document_dir(certificate_hash), filename)
+
+
+def get_document(certificate_hash, language, name):
+    """
+    Reads an issued document from the store
+    :return: the bytes of the PDF or None if it wasn't stored yet
+    """
+    try:
+        with open(document_path(certificate_hash, language, name), "rb") as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+
+def store_document(certificate_hash, language, name, content):
+    """
+    Saves an issued document in the store. The file is written under a temporary name and then renamed,
+    so concurrent readers never see a partially written PDF
+    """
+    directory = document_dir(certificate_hash)
+    os.makedirs(directory, exist_ok=True)
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "wb") as file:
+            file.write(content)
+        os.replace(temporary_path, document_path(certificate_hash, language, name))
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+def delete_documents(certificate_hash):
+    """
+    Removes every stored rendering (all languages, layout versions and names) of a document
+    """
+    for path in glob.glob(os.path.join(document_dir(certificate_hash), glob.escape(certificate_hash) + "-*.pdf")):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def document_etag(certificate_hash, language, name):
+    """
+    Entity tag of a document, that changes whenever the stored file would be rendered again
+    :param certificate_hash: validation code of the document
+    :param language: language in which the document is served
+    :param name: full name of the participant printed in the document
+    :return: the quoted ETag
+    """
+    key = "{hash}-{language}-v{version}-{name}".format(hash=certificate_hash, language=language, version=LAYOUT_VERSION, name=name)
+    return quote_etag(hashlib.sha1(key.encode("utf-8")).hexdigest())
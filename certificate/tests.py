@@ -1,3 +1,520 @@
-from django.test import TestCase
+import base64
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from user_profile.models import Participant, User
+from .codes import CODE_MAC_SIZE, make_code, normalize_code, read_code, sign
+from .linkcheck import check_links
+from .management.commands import send_emails
+from .models import ActivityLink, Certificate, CertificateCodeAlias, CourseModule, OutboxEmail
+from .storage import printed_name, store_document
+from .throttling import NoRenderSlot, render_slot
+from .views import get_certificate_by_hash, get_or_render_document, issue_certificate, parse_review_cursor, review_queue
+
+
+class LinkHandler(BaseHTTPRequestHandler):
+    """
+    Pages of a test site: /ok, /missing, a chain of redirects from /redirect/1, /no-head (that doesn't implement
+    HEAD) and /slow (that takes a second to answer)
+    """
+    redirects = {"/redirect/1": (302, "/redirect/2"), "/redirect/2": (301, "/redirect/3"), "/redirect/3": (307, "/ok")}
+
+    def do_HEAD(self):
+        self.server.requests.append(("HEAD", self.path))
+        if self.path == "/no-head":
+            self.answer(405)
+        else:
+            self.route()
+
+    def do_GET(self):
+        self.server.requests.append(("GET", self.path))
+        self.route()
+
+    def route(self):
+        if self.path in self.redirects:
+            status, location = self.redirects[self.path]
+            self.answer(status, location)
+        elif self.path == "/slow":
+            time.sleep(1)
+            self.answer(200)
+        elif self.path in ("/ok", "/no-head"):
+            self.answer(200)
+        else:
+            self.answer(404)
+
+    def answer(self, status, location=None):
+        self.send_response(status)
+        if location:
+            self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(LINK_CHECK_PRIVATE_ADDRESSES=True)
+class CheckLinksTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), LinkHandler)
+        cls.server.daemon_threads = True
+        cls.server.requests = []
+        cls.base_url = "http://127.0.0.1:{}".format(cls.server.server_address[1])
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.requests.clear()
+
+    def check(self, *paths, timeout=5):
+        return list(check_links([self.base_url + path for path in paths], delay=0, timeout=timeout))
+
+    def test_ok(self):
+        self.assertEqual(self.check("/ok"), [(self.base_url + "/ok", 200, self.base_url + "/ok", "")])
+        # The page is not downloaded
+        self.assertEqual(self.server.requests, [("HEAD", "/ok")])
+
+    def test_not_found(self):
+        self.assertEqual(self.check("/missing"), [(self.base_url + "/missing", 404, self.base_url + "/missing", "")])
+
+    def test_redirects(self):
+        self.assertEqual(self.check("/redirect/1"), [(self.base_url + "/redirect/1", 200, self.base_url + "/ok", "")])
+        self.assertEqual(self.server.requests, [("HEAD", "/redirect/1"), ("HEAD", "/redirect/2"),
+                                                ("HEAD", "/redirect/3"), ("HEAD", "/ok")])
+
+    def test_head_not_allowed(self):
+        self.assertEqual(self.check("/no-head"), [(self.base_url + "/no-head", 200, self.base_url + "/no-head", "")])
+        self.assertEqual(self.server.requests, [("HEAD", "/no-head"), ("GET", "/no-head")])
+
+    def test_timeout(self):
+        self.assertEqual(self.check("/slow", timeout=0.2), [(self.base_url + "/slow", None, None, "ReadTimeout")])
+
+    def test_results_in_order(self):
+        results = self.check("/missing", "/ok", "/redirect/1")
+        self.assertEqual([(url, status) for url, status, final_url, error in results],
+                         [(self.base_url + "/missing", 404), (self.base_url + "/ok", 200),
+                          (self.base_url + "/redirect/1", 200)])
+
+    @override_settings(LINK_CHECK_PRIVATE_ADDRESSES=False)
+    def test_private_address(self):
+        self.assertEqual(self.check("/ok"), [(self.base_url + "/ok", None, None, "The link points to a private address")])
+        self.assertEqual(self.server.requests, [])
+
+    def test_unsupported_link(self):
+        self.assertEqual(list(check_links(["ftp://127.0.0.1/file"], delay=0)),
+                         [("ftp://127.0.0.1/file", None, None, "Unsupported link")])
+
+
+@override_settings(RENDER_GLOBAL_LIMIT=2, CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class RenderSlotTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_limit(self):
+        first = render_slot()
+        with render_slot():
+            with self.assertRaises(NoRenderSlot):
+                render_slot()
+        # The slot released is taken again
+        with render_slot():
+            pass
+        first.release()
+
+    def test_expired_slot(self):
+        slot = render_slot()
+        # The slot expired and was taken by another render, that is not freed by the first one
+        cache.delete(slot.key)
+        other = render_slot()
+        self.assertEqual(other.key, slot.key)
+        slot.release()
+        self.assertEqual(cache.get(other.key), other.token)
+        other.release()
+        self.assertIsNone(cache.get(other.key))
+
+
+@override_settings(COORDINATORS_EMAILS=["coordinators@example.org"])
+class CoordinatorDigestTests(TestCase):
+    def send_digest(self):
+        out = StringIO()
+        call_command("send_coordinator_digest", stdout=out)
+        return out.getvalue().strip()
+
+    def test_requests_committed_late(self):
+        now = timezone.now()
+        first = User.objects.create(username="First", requested_certificate=True, date_of_request=now - timedelta(minutes=5))
+        self.assertEqual(self.send_digest(), "Summary of 1 certificate requests queued")
+        # Saved after the summary, with a date of request before its end
+        User.objects.create(username="Late", requested_certificate=True, date_of_request=now - timedelta(minutes=3))
+        self.assertEqual(self.send_digest(), "Summary of 1 certificate requests queued")
+        self.assertIn("Late", OutboxEmail.objects.order_by("-id").first().body)
+        self.assertEqual(self.send_digest(), "No new certificate requests")
+
+        # A new request of the same participant goes in the next summary
+        first.date_of_request = timezone.now()
+        first.save()
+        self.assertEqual(self.send_digest(), "Summary of 1 certificate requests queued")
+        self.assertEqual(OutboxEmail.objects.count(), 3)
+
+
+class CodeTests(SimpleTestCase):
+    def test_round_trip(self):
+        code = make_code(1234, "certificate", date(2024, 5, 17))
+        self.assertEqual(len(code), 32)
+        self.assertEqual(read_code(code), (1234, "certificate", date(2024, 5, 17)))
+        # Typed with spaces and in lowercase
+        typed = " ".join(code[i:i + 4] for i in range(0, 32, 4)).lower()
+        self.assertEqual(normalize_code(typed), code)
+        self.assertEqual(read_code(normalize_code(typed)).certificate_type, "certificate")
+
+    def test_tampered_code(self):
+        code = make_code(1234, "enrollment", date(2024, 5, 17))
+        token = base64.b32decode(code)
+        # Another id with the signature of the first one
+        payload = bytearray(token[CODE_MAC_SIZE:])
+        payload[-3] ^= 1
+        self.assertIsNone(read_code(base64.b32encode(token[:CODE_MAC_SIZE] + payload).decode("ascii")))
+        # Signed with another key
+        forged = sign(bytes(payload), secret="another key") + bytes(payload)
+        self.assertIsNone(read_code(base64.b32encode(forged).decode("ascii")))
+        self.assertIsNone(read_code("NOT A CODE"))
+
+    @override_settings(SECRET_KEY="new key", SECRET_KEY_FALLBACKS=["old key"])
+    def test_rotated_key(self):
+        with override_settings(SECRET_KEY="old key"):
+            code = make_code(1, "certificate", date(2024, 5, 17))
+        self.assertIsNotNone(read_code(code))
+
+    def test_legacy_code(self):
+        self.assertEqual(normalize_code("ABCDEF0123" * 4), "abcdef0123" * 4)
+        self.assertIsNone(read_code(normalize_code("ABCDEF0123" * 4)))
+
+
+@override_settings(RATE_LIMITS={})
+class ValidateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="Owner", first_name="Ana", last_name="Souza")
+        cls.certificate = issue_certificate(cls.user, "certificate")
+        cls.legacy = Certificate.objects.create(user=cls.user, certificate_type="enrollment", certificate_hash="abcdef0123" * 4)
+
+    def test_unknown_code(self):
+        unknown = make_code(self.certificate.id + 100, "certificate", date(2024, 5, 17))
+        for code in (unknown, "0" * 40, "garbled"):
+            response = self.client.post(reverse("validate_document"), {"hash": code})
+            self.assertEqual(response.status_code, 404)
+            self.assertTrue(response.context["checked"])
+            self.assertIsNone(response.context["certificate"])
+        # The check of a signed code is answered from its signature, the unknown sha1 codes are looked up
+        for code in ("0" * 40, "garbled"):
+            self.assertEqual(self.client.get(reverse("check_document", args=[code])).status_code, 404)
+
+    def test_check_mode(self):
+        # The signature is enough, the database is not queried
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse("validate_document"), {"hash": self.certificate.certificate_hash.lower(),
+                                                                       "mode": "check"})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.certificate.date_issued.strftime("%Y-%m-%d"))
+        self.assertEqual(response.context["certificate"].date_issued, self.certificate.date_issued.date())
+
+    def test_legacy_code_in_any_case(self):
+        for code in ("abcdef0123" * 4, "ABCDEF0123" * 4, " ".join(["AbCdEf0123"] * 4)):
+            response = self.client.post(reverse("validate_document"), {"hash": code, "mode": "check"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context["certificate"], self.legacy)
+            response = self.client.get(reverse("check_document", args=[code.replace(" ", "")]))
+            self.assertEqual(response.json()["certificate_type"], "enrollment")
+
+
+class CertificateLookupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="Owner", first_name="Ana", last_name="Souza")
+        cls.certificate = issue_certificate(cls.user, "certificate")
+        CertificateCodeAlias.objects.create(code="a" * 40, certificate=cls.certificate)
+
+    def test_code(self):
+        with self.assertNumQueries(1):
+            certificate_obj = get_certificate_by_hash(self.certificate.certificate_hash)
+            self.assertEqual(certificate_obj.user.username, "Owner")
+        self.assertEqual(certificate_obj, self.certificate)
+
+    def test_code_of_merged_duplicate(self):
+        with self.assertNumQueries(2):
+            certificate_obj = get_certificate_by_hash("a" * 40)
+            self.assertEqual(certificate_obj.user.username, "Owner")
+        self.assertEqual(certificate_obj, self.certificate)
+
+    def test_unknown_code(self):
+        self.assertIsNone(get_certificate_by_hash("b" * 40))
+
+
+class DocumentStoreTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings_override = override_settings(CERTIFICATES_ROOT=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_renamed_participant(self):
+        user = User.objects.create(username="Renamed", first_name="A", last_name="Lima")
+        code = issue_certificate(user, "certificate").certificate_hash
+        renders = []
+
+        def render(user, user_hash):
+            renders.append(user.first_name)
+            return user.first_name.encode()
+
+        # The name changes back and forth without a new UserModification, so the store is not cleaned
+        for first_name in ("A", "B", "A", "B"):
+            user.first_name = first_name
+            user.save()
+            self.assertEqual(get_or_render_document(user, code, render), first_name.encode())
+        self.assertEqual(renders, ["A", "B"])
+
+    @override_settings(RATE_LIMITS={})
+    def test_etag(self):
+        user = User.objects.create(username="Cached", first_name="A", last_name="Lima")
+        code = issue_certificate(user, "certificate").certificate_hash
+        store_document(code, "pt-br", printed_name(user), b"A")
+        url = reverse("validate_document") + "?hash=" + code
+
+        response = self.client.get(url)
+        self.assertEqual(response.content, b"A")
+        etag = response["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        # The name printed in the document changed, so the copy of the client is outdated
+        user.first_name = "B"
+        user.save()
+        store_document(code, "pt-br", printed_name(user), b"B")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"B")
+        self.assertNotEqual(response["ETag"], etag)
+
+
+@override_settings(COORDINATORS_EMAILS=["coordinators@example.org"])
+class ManageCertificatesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.organizer = User.objects.create(username="Organizer", is_organizer=True)
+        cls.participant = User.objects.create(username="Participant", first_name="Ana", email="ana@example.org",
+                                              requested_certificate=True, date_of_request=timezone.now())
+
+    def test_only_organizers(self):
+        self.client.force_login(self.participant)
+        response = self.client.post(reverse("manage_certificates"), {"usernames": ["Participant"], "problems_Participant": ["2"]})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response["Location"].startswith(reverse("login")))
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_redirect_after_post(self):
+        self.client.force_login(self.organizer)
+        url = reverse("manage_certificates") + "?year=2024"
+        response = self.client.post(url, {"usernames": ["Participant"], "problems_Participant": ["2"]})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+
+        # The count of emails is shown once, and reloading the page doesn't send them again
+        response = self.client.get(url)
+        self.assertContains(response, "1 mensagem foi colocada na fila de envio.")
+        response = self.client.get(url)
+        self.assertNotContains(response, "fila de envio")
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+
+
+class ReviewQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        modules = [CourseModule.objects.create(name="Module {}".format(order), order=order) for order in range(1, 7)]
+        requested_at = timezone.now() - timedelta(days=10)
+        for number in range(7):
+            user = User.objects.create(username="Participant{}".format(number), requested_certificate=True,
+                                       # Some requests made at the same time, ordered by the id
+                                       date_of_request=requested_at + timedelta(days=number // 2))
+            Participant.objects.create(username=user.username, enrolled_at=timezone.now().replace(year=2023 + number % 2))
+            for module in modules[1:]:
+                ActivityLink.objects.create(link="https://pt.wikipedia.org/wiki/{}".format(number), module=module, user=user)
+        User.objects.create(username="NotRequested")
+
+    def read_pages(self, page_size, **filters):
+        usernames = []
+        cursor = None
+        while True:
+            with self.assertNumQueries(2):
+                users, next_cursor = review_queue(cursor=cursor, page_size=page_size, **filters)
+                usernames.append([(user.username, user.enrolled_at.year, len(user.user_activity.all())) for user in users])
+            if not next_cursor:
+                return usernames
+            # The cursor goes through the query string of the next page
+            cursor = parse_review_cursor(next_cursor)
+
+    def test_pages(self):
+        everyone = [("Participant{}".format(number), 2023 + number % 2, 5) for number in range(7)]
+        self.assertEqual(self.read_pages(3), [everyone[:3], everyone[3:6], everyone[6:]])
+        self.assertEqual(self.read_pages(7), [everyone])
+        self.assertEqual(self.read_pages(2, year=2024), [[everyone[1], everyone[3]], [everyone[5]]])
+
+    def test_invalid_cursor(self):
+        self.assertIsNone(parse_review_cursor("not a cursor"))
+        self.assertIsNone(parse_review_cursor(None))
+
+
+@override_settings(COORDINATOR_DIGEST=True)
+class ActivityLinksTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="Participant", first_name="Ana", last_name="Souza", email="ana@example.org")
+        Participant.objects.create(username="Participant")
+        cls.modules = [CourseModule.objects.create(name="Module {}".format(order), order=order) for order in range(1, 6)]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def request_certificate(self, links):
+        data = {"form-TOTAL_FORMS": "5", "form-INITIAL_FORMS": "5", "form-MIN_NUM_FORMS": "5", "form-MAX_NUM_FORMS": "5"}
+        data.update({"form-{}-link".format(index): link for index, link in enumerate(links)})
+        return self.client.post(reverse("certificate"), data)
+
+    def test_missing_modules(self):
+        # Only four modules with activities, the last link would be dropped
+        response = self.request_certificate(["https://pt.wikipedia.org/wiki/{}".format(number) for number in range(5)])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "As atividades do curso ainda não estão disponíveis.")
+        self.assertFalse(ActivityLink.objects.exists())
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.requested_certificate)
+
+    def test_links_replaced(self):
+        CourseModule.objects.create(name="Module 6", order=6)
+        self.request_certificate(["https://pt.wikipedia.org/wiki/{}".format(number) for number in range(5)])
+        self.assertEqual(ActivityLink.objects.filter(user=self.user).count(), 5)
+        ActivityLink.objects.update(status_code=404, revision_id=1)
+
+        # The participant changes the links and requests again
+        self.client.get(reverse("change_links", args=["certificate"]))
+        self.request_certificate(["https://pt.wikiversity.org/wiki/{}".format(number) for number in range(5)])
+        links = list(ActivityLink.objects.filter(user=self.user).order_by("module__order"))
+        self.assertEqual([(link.module_id, link.link) for link in links],
+                         [(module.id, "https://pt.wikiversity.org/wiki/{}".format(number))
+                          for number, module in enumerate(CourseModule.objects.order_by("order")[1:])])
+        # The results of the checks of the old links are discarded
+        self.assertEqual({(link.status_code, link.revision_id) for link in links}, {(None, None)})
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.requested_certificate)
+
+
+class FlakyEmailBackend(EmailBackend):
+    """
+    Mail server that refuses connections while `down` and the emails to the addresses in `rejected`
+    """
+    down = False
+    rejected = set()
+
+    def open(self):
+        if self.down:
+            raise ConnectionRefusedError("Connection refused")
+        return super().open()
+
+    def send_messages(self, messages):
+        for message in messages:
+            if set(message.to) & self.rejected:
+                raise OSError("Mailbox unavailable")
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND="certificate.tests.FlakyEmailBackend")
+class SendEmailsTests(TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, FlakyEmailBackend, "down", False)
+        self.addCleanup(setattr, FlakyEmailBackend, "rejected", set())
+
+    def queue(self, *addresses):
+        return [OutboxEmail.objects.create(subject="Subject", body="<p>Body</p>", from_email="from@example.org", to=[address])
+                for address in addresses]
+
+    def send_emails(self, *args):
+        call_command("send_emails", *args, stdout=StringIO(), stderr=StringIO())
+
+    def test_backoff(self):
+        FlakyEmailBackend.rejected = {"rejected@example.org"}
+        rejected, accepted = self.queue("rejected@example.org", "accepted@example.org")
+        self.send_emails()
+
+        # The failure doesn't stop the other emails
+        accepted.refresh_from_db()
+        self.assertEqual(accepted.status, "sent")
+        rejected.refresh_from_db()
+        self.assertEqual((rejected.status, rejected.attempts, rejected.last_error), ("pending", 1, "Mailbox unavailable"))
+        self.assertAlmostEqual(rejected.next_attempt_at - timezone.now(), send_emails.backoff(1), delta=timedelta(seconds=5))
+
+        # Each attempt waits twice as long, until the email is given up
+        for attempts in range(2, send_emails.MAX_ATTEMPTS + 1):
+            OutboxEmail.objects.filter(pk=rejected.pk).update(next_attempt_at=timezone.now())
+            self.send_emails()
+            rejected.refresh_from_db()
+            self.assertEqual(rejected.attempts, attempts)
+            if attempts < send_emails.MAX_ATTEMPTS:
+                self.assertEqual(send_emails.backoff(attempts), 2 * send_emails.backoff(attempts - 1))
+                self.assertGreater(rejected.next_attempt_at, timezone.now() + send_emails.backoff(attempts - 1))
+        self.assertEqual(rejected.status, "failed")
+
+        # Once failed, the email is not taken again
+        OutboxEmail.objects.filter(pk=rejected.pk).update(next_attempt_at=timezone.now())
+        self.send_emails()
+        rejected.refresh_from_db()
+        self.assertEqual(rejected.attempts, send_emails.MAX_ATTEMPTS)
+
+    def test_mail_server_unavailable(self):
+        FlakyEmailBackend.down = True
+        first, second = self.queue("first@example.org", "second@example.org")
+        with self.assertRaises(CommandError):
+            self.send_emails()
+
+        # The emails claimed are released without counting an attempt, instead of waiting for the lease to expire
+        for outbox_email in (first, second):
+            outbox_email.refresh_from_db()
+            self.assertEqual((outbox_email.status, outbox_email.attempts), ("pending", 0))
+            self.assertLessEqual(outbox_email.next_attempt_at, timezone.now())
+
+        # The worker waits longer after each outage, and sends the emails once the server is back
+        waits = []
+
+        def sleep(seconds):
+            waits.append(seconds)
+            if len(waits) == 3:
+                FlakyEmailBackend.down = False
+            elif len(waits) > 3:
+                raise KeyboardInterrupt
+
+        with mock.patch.object(send_emails.time, "sleep", sleep), self.assertRaises(KeyboardInterrupt):
+            self.send_emails("--loop", "--interval", "2")
+        self.assertEqual(waits, [2, 4, 8, 2])
+        self.assertEqual(OutboxEmail.objects.filter(status="sent").count(), 2)
+        self.assertEqual(OutboxEmail.objects.filter(attempts=1).count(), 2)
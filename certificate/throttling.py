@@ -0,0 +1,132 @@
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.translation import gettext_lazy as _
+
+
+#######################################
+# RATE LIMITS
+#######################################
+def client_ip(request):
+    """
+    Address of the client. Behind a proxy, RATE_LIMIT_IP_HEADER names the header where the proxy appends it
+    """
+    if settings.RATE_LIMIT_IP_HEADER:
+        forwarded = request.META.get(settings.RATE_LIMIT_IP_HEADER, "")
+        if forwarded:
+            # The proxy appends the address it received the request from, any address before it can be forged
+            return forwarded.split(",")[-1].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def hit(key, limit, period):
+    """
+    Counts a request in the current window of the period
+    :return: True if the limit of requests in the window was exceeded
+    """
+    window = int(time.time() // period)
+    key = "{}:{}".format(key, window)
+    cache.add(key, 0, period)
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # The window expired between the two calls
+        cache.set(key, 1, period)
+        count = 1
+    return count > limit
+
+
+def rate_limit(scope):
+    """
+    Limits the requests of a view by client address and by user, as configured in RATE_LIMITS[scope]. The counters
+    are kept in the cache, so they are shared by the web workers when the cache is
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            limits = settings.RATE_LIMITS.get(scope, {})
+            period = settings.RATE_LIMIT_PERIOD
+            exceeded = False
+            if limits.get("ip"):
+                exceeded |= hit("ratelimit:{}:ip:{}".format(scope, client_ip(request)), limits["ip"], period)
+            if limits.get("user") and request.user.is_authenticated:
+                exceeded |= hit("ratelimit:{}:user:{}".format(scope, request.user.pk), limits["user"], period)
+            if exceeded:
+                response = HttpResponse(_("Too many requests. Please try again in a few moments."),
+                                        status=429, content_type="text/plain; charset=utf-8")
+                response["Retry-After"] = str(period)
+                return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+#######################################
+# ADMISSION CONTROL
+#######################################
+class NoRenderSlot(Exception):
+    """
+    RENDER_GLOBAL_LIMIT documents are already being rendered
+    """
+
+
+class RenderSlot:
+    """
+    One of the RENDER_GLOBAL_LIMIT slots of documents rendered at the same time by all the web workers. A slot is a
+    key in the cache holding a token of its holder, that expires after RENDER_SLOT_TIMEOUT so a worker that dies
+    while rendering doesn't hold it forever. Used as a context manager, the slot is released at the end of the block
+    :raise NoRenderSlot: if every slot is taken
+    """
+    def __init__(self):
+        self.token = uuid.uuid4().hex
+        for slot in range(settings.RENDER_GLOBAL_LIMIT):
+            self.key = "render-slot:{}".format(slot)
+            if cache.add(self.key, self.token, settings.RENDER_SLOT_TIMEOUT):
+                return
+        raise NoRenderSlot()
+
+    def release(self):
+        """
+        Frees the slot. A slot that expired may have been taken by another render, so it's only deleted while it
+        still holds the token of this one
+        """
+        if cache.get(self.key) == self.token:
+            cache.delete(self.key)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def render_slot():
+    """
+    Takes a free render slot
+    :return: the RenderSlot
+    :raise NoRenderSlot: if every slot is taken
+    """
+    return RenderSlot()
+
+
+def wait_for_render_slot(timeout, interval=0.5):
+    """
+    Waits for a free render slot, for the documents that are not requested by someone waiting for them, like the
+    ones of an export
+    :param timeout: seconds to wait for the slot
+    :param interval: seconds between the attempts
+    :return: the RenderSlot
+    :raise NoRenderSlot: if no slot is freed in time
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return RenderSlot()
+        except NoRenderSlot:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(interval)
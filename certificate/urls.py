@@ -6,5 +6,8 @@ urlpatterns = [
     path('enrollment_letter/', views.enrollment_letter, name='enrollment_letter'),
     path('change_links/<str:next_url>', views.change_links, name='change_links'),
     path('manage_certificates/', views.manage_certificates, name='manage_certificates'),
-    path('validate/', views.validate, name='validate_document')
+    path('manage_certificates/export/', views.export_certificates, name='export_certificates'),
+    path('manage_certificates/render_status/', views.render_status, name='render_status'),
+    path('validate/', views.validate, name='validate_document'),
+    path('validate/<str:certificate_hash>/', views.check_document, name='check_document'),
 ]
@@ -1,23 +1,34 @@
-import locale
-import math
-import os
-import hashlib
 from datetime import datetime
+from functools import lru_cache
+from concurrent.futures.process import BrokenProcessPool
 from fpdf import FPDF
 
 from django.conf import settings
-from django.contrib.auth.decorators import login_required
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.core.mail import EmailMultiAlternatives
-from django.forms import formset_factory
-from django.http import HttpResponse
+from django.db import connection as db_connection
+from django.db.models import OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, reverse, redirect
-from django.utils import timezone
+from django.utils import timezone, translation
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.html import escape
 from django.utils.translation import gettext_lazy as _
-from django.utils.translation import get_language
+from django.utils.translation import get_language, ngettext
 
 from user_profile.models import User, Participant
-from certificate.forms import ActivityLinkForm
-from certificate.models import ActivityLink, Certificate
+from certificate.forms import ActivityLinkFormSet, NUMBER_OF_ACTIVITIES
+from certificate.models import ActivityLink, Certificate, CertificateCodeAlias, OutboxEmail, activity_module_ids
+from certificate.assets import load_assets
+from certificate.export import stream_zip
+from certificate.rendering import online_render_pool, RenderPoolSaturated
+from certificate.revisions import fetch_revisions
+from certificate.throttling import rate_limit, render_slot, wait_for_render_slot, NoRenderSlot
+from certificate.codes import make_code, normalize_code, is_legacy_code, read_code
+from certificate.layouts import compile_layout, draw_layout, format_layout_date, prerender_layout, compose_layout
+from certificate.storage import get_document, store_document, document_etag, printed_name
 
 
 #######################################
@@ -29,35 +40,21 @@ def certificate(request):
 
     if user.first_name and user.last_name and user.email:
         is_student = Participant.objects.filter(username=user.username).exists()
-        ActivitiesForm = formset_factory(ActivityLinkForm, max_num=5, validate_max=True, can_delete=False)
+        module_ids = activity_module_ids()[:NUMBER_OF_ACTIVITIES]
         if request.method == "POST":
-            formset = ActivitiesForm(request.POST)
+            formset = ActivityLinkFormSet(request.POST)
+            # The formset has one link for each of the NUMBER_OF_ACTIVITIES modules, and is invalid while they are missing
             if formset.is_valid():
-                for form in formset:
-                    form_id = int(form.prefix.replace("form-", "")) + 2  # Activities start in the 2nd module
-                    try:
-                        activity_link = ActivityLink.objects.get(module_id=form_id, user=user)
-                        activity_link.link = form.cleaned_data["link"]
-                        activity_link.save()
-                    except ActivityLink.DoesNotExist:
-                        ActivityLink.objects.create(module_id=form_id,
-                                                    user=user,
-                                                    link=form.cleaned_data["link"])
-                send_email_to_coordinator(user)
+                save_activity_links(user, {module_id: form.cleaned_data["link"] for module_id, form in zip(module_ids, formset)})
+                # In the digest mode, the request is reported by the send_coordinator_digest command
+                if not settings.COORDINATOR_DIGEST:
+                    send_email_to_coordinator(user)
                 user.requested_certificate = True
-                user.date_of_request = datetime.now(tz=timezone.utc)
+                user.date_of_request = timezone.now()
                 user.save()
         else:
-            if ActivityLink.objects.filter(user=user).exists():
-                formset = ActivitiesForm(initial=[
-                    {'link': ActivityLink.objects.get(module_id=2, user=user).link},
-                    {'link': ActivityLink.objects.get(module_id=3, user=user).link},
-                    {'link': ActivityLink.objects.get(module_id=4, user=user).link},
-                    {'link': ActivityLink.objects.get(module_id=5, user=user).link},
-                    {'link': ActivityLink.objects.get(module_id=6, user=user).link},
-                ])
-            else:
-                formset = ActivitiesForm(initial=[{'link': ""}, {'link': ""}, {'link': ""}, {'link': ""}, {'link': ""}])
+            links = dict(ActivityLink.objects.filter(user=user).values_list("module_id", "link"))
+            formset = ActivityLinkFormSet(initial=[{'link': links.get(module_id, "")} for module_id in module_ids])
 
         user_requested_certificate = user.requested_certificate
         date_of_request = user.date_of_request or None
@@ -70,6 +67,22 @@ def certificate(request):
         return redirect(reverse("profile"))
 
 
+def save_activity_links(user, links):
+    """
+    Creates or replaces the links of the activities of a participant in a single query. The result of the last check
+    of the links and the edits they pointed to are discarded, so they are looked up again
+    :param user: participant submitting the activities
+    :param links: dictionary of module id to the link of the activity of the module
+    """
+    activity_links = [ActivityLink(module_id=module_id, user=user, link=link) for module_id, link in links.items()]
+    # Backends without ON CONFLICT targets (MySQL) resolve the conflict on the unique (module, user) by themselves
+    unique_fields = ["module", "user"] if db_connection.features.supports_update_conflicts_with_target else None
+    ActivityLink.objects.bulk_create(activity_links, update_conflicts=True, unique_fields=unique_fields,
+                                     update_fields=["link", "status_code", "final_url", "check_error", "checked_at",
+                                                    "revision_id", "page_title", "revision_user", "revision_size_delta",
+                                                    "revision_timestamp", "revision_fetched_at"])
+
+
 @login_required()
 def change_links(request, next_url):
     """
@@ -83,357 +96,447 @@ def change_links(request, next_url):
     return redirect(reverse(next_url))
 
 
-@login_required()
+def is_organizer(user):
+    return user.is_authenticated and bool(user.is_organizer or user.is_superuser)
+
+
+@user_passes_test(is_organizer)
 def manage_certificates(request):
     """
-    Loads page for organizers to manage and send certificates or messages
+    Loads page for organizers to manage and send certificates or messages. The participants are listed in pages,
+    in the order they requested the certificate, and can be filtered by the date of the request or by the year
+    of the enrollment. The edits the activity links of the page point to can be looked up in the wikis. The forms
+    redirect back to the same page, so reloading it doesn't send the emails again
     """
-    users = User.objects.filter(requested_certificate=True)
-    for user in users:
-        # TODO: improve performance if this becomes slow
-        user.enrolled_at = None
-        participant = Participant.objects.filter(username=user.username).first()
-        if participant:
-            user.enrolled_at = participant.enrolled_at
+    filters = {"requested_from": parse_filter_date(request.GET.get("requested_from")),
+               "requested_until": parse_filter_date(request.GET.get("requested_until")),
+               "year": parse_filter_year(request.GET.get("year"))}
 
     if request.method == "POST":
         form = request.POST
-        username = form.get("username")
-        problems = form.getlist('checkboxes[]')
-        send_email_to_user(problems, username)
-
-    context = {"users": users}
+        # The button to look up the edits of the activities sends the same form, without the participants selected
+        if "fetch_revisions" in form:
+            # The edits of the activities of the participants in this page are looked up in a few queries to each wiki
+            users, next_cursor = review_queue(cursor=parse_review_cursor(request.GET.get("after")), **filters)
+            number_of_revisions = fetch_revisions(request, [activity_link for user in users for activity_link in user.user_activity.all()])
+            messages.info(request, ngettext("%(counter)s edit was found.", "%(counter)s edits were found.",
+                                            number_of_revisions) % {"counter": number_of_revisions})
+        else:
+            # The button of a row sends only that participant, otherwise every selected participant is sent
+            if form.get("username"):
+                usernames = [form.get("username")]
+            else:
+                usernames = form.getlist("usernames")
+            decisions = {username: form.getlist("problems_" + username) for username in usernames}
+            number_of_emails = send_emails_to_users(decisions)
+            messages.info(request, ngettext("%(counter)s message was queued to be sent.",
+                                            "%(counter)s messages were queued to be sent.",
+                                            number_of_emails) % {"counter": number_of_emails})
+        return redirect(request.get_full_path())
+
+    users, next_cursor = review_queue(cursor=parse_review_cursor(request.GET.get("after")), **filters)
+
+    next_page = None
+    if next_cursor:
+        query = request.GET.copy()
+        query["after"] = next_cursor
+        next_page = "?" + query.urlencode()
+
+    context = {"users": users,
+               "filters": request.GET,
+               "next_page": next_page}
     return render(request, 'certificate/manage_certificates.html', context)
 
 
+#######################################
+# REVIEW QUEUE
+#######################################
+REVIEW_PAGE_SIZE = 50
+
+
+def review_queue(cursor=None, requested_from=None, requested_until=None, year=None, page_size=REVIEW_PAGE_SIZE):
+    """
+    Page of the participants waiting for the review of their certificate. The page is loaded in two queries,
+    however many participants are waiting: one for the users, with the date of enrollment attached by a subquery,
+    and one for their activities, with the modules
+    :param cursor: (requested_at, id) of the last participant of the previous page, or None for the first page
+    :param requested_from: only requests made at or after this date
+    :param requested_until: only requests made before the end of this date
+    :param year: only participants enrolled in this year
+    :param page_size: number of participants in the page
+    :return: the list of users of the page and the cursor of the next page (None in the last page)
+    """
+    enrolled_at = Participant.objects.filter(username=OuterRef("username")).order_by("id").values("enrolled_at")[:1]
+    users = (User.objects.filter(requested_certificate=True)
+             .annotate(enrolled_at=Subquery(enrolled_at),
+                       requested_at=Coalesce("date_of_request", "date_joined"))
+             .prefetch_related(Prefetch("user_activity",
+                                        queryset=ActivityLink.objects.select_related("module").order_by("module__order"))))
+
+    if requested_from:
+        users = users.filter(requested_at__date__gte=requested_from)
+    if requested_until:
+        users = users.filter(requested_at__date__lte=requested_until)
+    if year:
+        users = users.filter(enrolled_at__year=year)
+    if cursor:
+        requested_at, user_id = cursor
+        users = users.filter(Q(requested_at__gt=requested_at) | Q(requested_at=requested_at, id__gt=user_id))
+
+    users = list(users.order_by("requested_at", "id")[:page_size + 1])
+    if len(users) <= page_size:
+        return users, None
+
+    users = users[:page_size]
+    last = users[-1]
+    return users, "{}_{}".format(last.requested_at.isoformat(), last.id)
+
+
+def parse_review_cursor(value):
+    """
+    Reads the cursor of a page of the review queue, ignoring values that were not made by review_queue
+    """
+    try:
+        requested_at, user_id = (value or "").rsplit("_", 1)
+        return datetime.fromisoformat(requested_at), int(user_id)
+    except ValueError:
+        return None
+
+
+def parse_filter_date(value):
+    try:
+        return datetime.strptime(value or "", "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def parse_filter_year(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@user_passes_test(is_organizer)
+def export_certificates(request):
+    """
+    Downloads a ZIP archive with the certificates of completion of the participants enrolled in a year. The archive
+    is streamed while the certificates are read from the store or rendered, sharing the render slots with the downloads
+    """
+    year = parse_filter_year(request.GET.get("year"))
+    if not year:
+        return HttpResponseBadRequest(_("Inform the year of enrollment of the participants"))
+
+    enrolled = Participant.objects.filter(enrolled_at__year=year).values("username")
+    certificates = (Certificate.objects.select_related("user")
+                    .filter(certificate_type="certificate", user__username__in=enrolled)
+                    .order_by("user__username"))
+    language = get_language() or settings.LANGUAGE_CODE
+    documents = ((certificate_filename(certificate_obj.user.username), render_exported_document, (certificate_obj, language))
+                 for certificate_obj in certificates.iterator(chunk_size=100))
+
+    response = StreamingHttpResponse(stream_zip(documents), content_type="application/zip")
+    response["Content-Disposition"] = str(_('attachment; filename=WikiConecta - Certificates - {year}.zip').format(year=year))
+    return response
+
+
+@rate_limit("validate")
 def validate(request):
-    if request.method == "POST":
-        hash_to_check = request.POST.get("hash") or ""
-        certificate_obj = Certificate.objects.get(certificate_hash=hash_to_check)
+    """
+    Validates a document from its validation code, sent by the form (POST) or in a link (GET, with the hash
+    in the query string). Links can be answered with 304 by the browser and by proxies
+    """
+    hash_to_check = request.POST.get("hash") if request.method == "POST" else request.GET.get("hash")
+    if request.method != "POST" and not hash_to_check:
+        return render(request, 'certificate/validator.html')
 
-        if certificate_obj.certificate_type == "enrollment":
-            certificate_file = generate_enrollment_letter(certificate_obj.user_id)
-            response = HttpResponse(certificate_file, content_type='application/pdf')
-            response["Content-Disposition"] = str(_('attachment; filename=WikiConecta - Enrollment - {name}.pdf').format(name=certificate_obj.user.username))
-        else:
-            certificate_file = generate_certificate(certificate_obj.user_id)
-            response = HttpResponse(certificate_file, content_type='application/pdf')
-            response["Content-Disposition"] = str(_('attachment; filename=WikiConecta - Certificate of Completion - {name}.pdf').format(name=certificate_obj.user.username))
-        return response
+    hash_to_check = normalize_code(hash_to_check)
+    signed_code = None if is_legacy_code(hash_to_check) else read_code(hash_to_check)
+    if request.POST.get("mode") == "check" and signed_code:
+        # The signature is enough to tell the document was issued, and when
+        context = {"checked": True, "certificate": signed_code}
+        return render(request, 'certificate/validator.html', context)
+
+    certificate_obj = get_certificate_by_hash(hash_to_check)
+    if not certificate_obj:
+        context = {"checked": True, "certificate": None}
+        return render(request, 'certificate/validator.html', context, status=404)
+
+    if request.POST.get("mode") == "check":
+        context = {"checked": True, "certificate": certificate_obj}
+        return render(request, 'certificate/validator.html', context)
+
+    if certificate_obj.certificate_type == "enrollment":
+        filename = str(_('attachment; filename=WikiConecta - Enrollment - {name}.pdf').format(name=certificate_obj.user.username))
     else:
-        return render(request, 'certificate/validator.html')
+        filename = str(_('attachment; filename=WikiConecta - Certificate of Completion - {name}.pdf').format(name=certificate_obj.user.username))
+    return document_response(request, certificate_obj, filename, private=False)
+
+
+def check_document(request, certificate_hash):
+    """
+    Answers if a validation code belongs to a document issued by WikiConecta, without generating the document
+    """
+    certificate_hash = normalize_code(certificate_hash)
+    if not is_legacy_code(certificate_hash):
+        # Signed codes are answered from the signature alone
+        signed_code = read_code(certificate_hash)
+        if not signed_code:
+            return JsonResponse({"valid": False}, status=404)
+        return JsonResponse({"valid": True,
+                             "certificate_type": signed_code.certificate_type,
+                             "date_issued": signed_code.date_issued.isoformat()})
+
+    certificate_obj = get_certificate_by_hash(certificate_hash)
+    if not certificate_obj:
+        return JsonResponse({"valid": False}, status=404)
+
+    return JsonResponse({"valid": True,
+                         "certificate_type": certificate_obj.certificate_type,
+                         "date_issued": certificate_obj.date_issued.isoformat()})
+
+
+def get_certificate_by_hash(certificate_hash):
+    """
+    Looks for an issued document and its owner by its code, in one query on the unique index of the codes. Only the
+    codes not found are looked up among the codes of the duplicates merged into another document. Signed codes that
+    fail the check of their signature are rejected without querying the database
+    :param certificate_hash: normalized validation code of the document
+    :return: the Certificate or None if the code is unknown
+    """
+    if not certificate_hash:
+        return None
+    if not is_legacy_code(certificate_hash) and not read_code(certificate_hash):
+        return None
+    certificate_obj = Certificate.objects.select_related("user").filter(certificate_hash=certificate_hash).first()
+    if certificate_obj:
+        return certificate_obj
+    alias = CertificateCodeAlias.objects.select_related("certificate__user").filter(code=certificate_hash).first()
+    return alias.certificate if alias else None
 
 
 #######################################
 # PDF generators
 #######################################
+# Seconds a client is asked to wait when the online render pool is full
+RETRY_AFTER = "5"
+# Seconds a document of an export waits for a render slot
+EXPORT_SLOT_WAIT = 60
+
+
 class SubsPDF(FPDF):
-    def __init__(self, user_hash, orientation='P', unit='mm', format='A4'):
+    def __init__(self, user_hash, footer_text, orientation='P', unit='mm', format='A4'):
         super().__init__(orientation, unit, format)
         self.user_hash = user_hash
+        self.footer_text = footer_text
+        load_assets(self, fonts=['Baloo2-Bold'], images=['header', 'alex', 'jap'])
 
     def footer(self):
         self.set_y(-18)
         self.set_font('Times', '', 9)
-        self.multi_cell(w=0, h=4.5, border=0, align='C', txt=str(_('The validity of this document can be checked at https://wikiconecta.toolforge.org/\nThe validation code is: {code}').format(code=self.user_hash)))
+        self.multi_cell(w=0, h=4.5, border=0, align='C', txt=self.footer_text.format(code=self.user_hash))
 
 
 class CertificationPDF(FPDF):
-    def __init__(self, user_hash, orientation='P', unit='mm', format='A4'):
+    def __init__(self, user_hash, footer_text, orientation='P', unit='mm', format='A4'):
         super().__init__(orientation, unit, format)
         self.user_hash = user_hash
+        self.footer_text = footer_text
+        load_assets(self, fonts=['Baloo2-Regular', 'Baloo2-Bold'], images=['background', 'alex', 'jap'])
 
     def footer(self):
         self.set_y(-25)
         self.set_font('Baloo2-Regular', '', 9)
-        self.multi_cell(w=0, h=4.5, border=0, align='C', txt=str(_('The validity of this document can be checked at https://wikiconecta.toolforge.org/\nThe validation code is: {code}').format(code=self.user_hash)))
+        self.multi_cell(w=0, h=4.5, border=0, align='C', txt=self.footer_text.format(code=self.user_hash))
 
 
 @login_required()
+@rate_limit("enrollment_letter")
 def enrollment_letter(request):
-    user_id = request.user.id
-    return generate_enrollment_letter(user_id)
+    user = request.user
+    certificate_obj = issue_certificate(user, "enrollment")
+    certificate_obj.user = user
+    filename = str(_('attachment; filename=WikiConecta - Enrollment - {name}.pdf').format(name=user.username))
+    return document_response(request, certificate_obj, filename, private=True)
 
 
-def set_language_if_ptbr(language):
-    if language == "pt-br":
-        return "pt_BR"
-    else:
-        return language
+def issue_certificate(user, certificate_type):
+    """
+    Gets the validation code of a document of the participant, issuing the document the first time it is requested.
+    Concurrent requests get the same document: the pair (user, certificate_type) is unique and the validation code
+    is derived only from the id, the type and the frozen issue date, so any request can fill a missing code
+    :param User user: owner of the document
+    :param certificate_type: "enrollment" or "certificate"
+    :return: the Certificate, with its validation code
+    """
+    certificate_obj, created = Certificate.objects.get_or_create(user_id=user.id, certificate_type=certificate_type)
+    if not certificate_obj.certificate_hash:
+        certificate_obj.certificate_hash = make_code(certificate_obj.id, certificate_type, certificate_obj.date_issued)
+        Certificate.objects.filter(Q(certificate_hash__isnull=True) | Q(certificate_hash=""), pk=certificate_obj.pk).update(certificate_hash=certificate_obj.certificate_hash)
+    return certificate_obj
 
 
 def generate_enrollment_letter(user_id=None):
     user = User.objects.get(pk=user_id)
+    user_hash = issue_certificate(user, "enrollment").certificate_hash
+    file = get_or_render_document(user, user_hash, render_enrollment_letter)
 
-    certificate_obj, created = Certificate.objects.get_or_create(user_id=user.id, certificate_type="enrollment")
-    if created:
-        user_hash = hashlib.sha1(bytes("Enrollment letter " + certificate_obj.user.username + str(certificate_obj.date_issued), 'utf-8')).hexdigest()
-        certificate_obj.certificate_hash = user_hash
-        certificate_obj.save()
-    else:
-        user_hash = certificate_obj.certificate_hash
+    response = HttpResponse(file, content_type='application/pdf')
+    response["Content-Disposition"] = str(_('attachment; filename=WikiConecta - Enrollment - {name}.pdf').format(name=user.username))
+    return response
 
-    # Create page
-    pdf = SubsPDF(orientation='P', unit='mm', format='A4', user_hash=user_hash)
 
-    pdf.set_margins(30, 10, 20)
-    pdf.add_page()
+def render_enrollment_letter(user, user_hash):
+    """
+    Draws the enrollment letter of a participant over its pre-rendered static content
+    """
+    language = get_language()
+    layout = compile_layout("enrollment", language)
+    pdf = SubsPDF(orientation=layout["orientation"], unit='mm', format='A4', user_hash=user_hash, footer_text=layout["footer"])
 
-    pdf.set_draw_color(75, 82, 209)
-    pdf.set_text_color(255, 255, 255)  # Title in white color
-    pdf.image(os.path.join(settings.STATIC_ROOT, 'images/wikiconecta-header.png'), x=0, y=0, w=210)
-    # Box for the title
-    pdf.set_text_color(255, 255, 255)  # Title in white color
-    pdf.add_font(family='Baloo2-Bold', fname=os.path.join(settings.STATIC_ROOT, 'fonts/Baloo2-Bold.ttf'), uni=True)
-    pdf.set_font('Baloo2-Bold', '', 25)  # Title in Times New Roman, bold, 15pt
-    # Title text
-    pdf.set_x(30)
-    pdf.cell(w=150, h=12, border=0, ln=1, align='C', fill=False, txt='WikiConecta')
-    pdf.set_text_color(0, 0, 0)  # Title in white color
+    context = {"name": user.first_name + " " + user.last_name,
+               "date": format_layout_date(layout, datetime.now())}
+    compose_layout(pdf, prerender_enrollment_letter(language), context)
 
-    #######################################################################################################
-    # Data
-    #######################################################################################################
-    pdf.set_xy(30, 42)  # Start the letter text at the 10x42mm point
+    # Generate the file
+    return pdf.output(dest='S').encode('latin-1')
 
-    pdf.set_font('Times', '', 13)  # Text of the body in Times New Roman, regular, 13 pt
 
-    locale.setlocale(locale.LC_TIME, set_language_if_ptbr(get_language()))
-    pdf.cell(w=150, h=9, border=0, ln=1, align='L', txt=str(_('São Paulo, ')) + datetime.now().strftime(str(_("%B %d, %Y"))))
+@lru_cache(maxsize=None)
+def prerender_enrollment_letter(language):
+    """
+    Static content of the enrollment letter, drawn once per language by each worker. It follows the layout of
+    this version of the code, the same LAYOUT_VERSION of the stored documents
+    """
+    layout = compile_layout("enrollment", language)
+    pdf = SubsPDF(orientation=layout["orientation"], unit='mm', format='A4', user_hash="", footer_text=layout["footer"])
+    return prerender_layout(pdf, layout)
 
-    pdf.cell(w=0, h=9, ln=1)  # New line
 
-    #######################################################################################################
-    # To whom it may concern
-    #######################################################################################################
-    pdf.set_font('Times', 'B', 13)  # Text of the addressing in Times New Roman, bold, 13 pt
-    pdf.cell(w=150, h=9, txt=str(_('To whom it may concern')), border=0, ln=1, align='L')
+def generate_certificate(user_id=None):
+    """
+    Generates a certificate of completion for the course WikiConecta
+    """
+    user = User.objects.get(pk=user_id)
+    user_hash = issue_certificate(user, "certificate").certificate_hash
+    return get_or_render_document(user, user_hash, render_certificate)
 
-    pdf.cell(w=0, h=9, ln=1)  # New line
 
-    #######################################################################################################
-    # User data
-    #######################################################################################################
-    try:
-        name = user.first_name + ' ' + user.last_name
-    except AttributeError:
-        name = user.username  # User full name
-
-    #######################################################################################################
-    # Text
-    #######################################################################################################
-    pdf.set_font('Times', '', 13)  # Text of the addressing in Times New Roman, bold, 13 pt
-    pdf.multi_cell(w=0, h=9, border=0, align='J', txt=str(_("""The WikiConecta course (https://w.wiki/7KwX) was developed by Wiki Movimento Brasil, a non-profit organization that works towards free knowledge under CNPJ 29.801.908/0001-86. To complete it, 20 hours of dedication are required, asynchronously and independently, and the course is available on an open online education platform, the Wikiversity.\n\nThe units were developed by Professor Amanda Chevtchouk Jurno, PhD, former Education and Scientific Dissemination Manager at Wiki Movimento Brasil, with scientific guidance from Professor João Alexandre Peschanski, PhD, Executive Director of Wiki Movimento Brasil. In order to adapt the content to the expectations of the Wikimedia Movement and ensure that it covered the information necessary to introduce educators to this universe, the course had strategic guidance from senior members of the Movement working in the area of Education in various regions of the world.\n\nThe objective of the course is to present in a condensed form the information that educators need to start using the Wikimedia projects with their students, especially in university extension. At the end of the course, participants should be able to basic edit four Wikimedia projects - Wikipedia, Wikidata, Wikimedia Commons and Wikiversity - and develop their own wiki-education programs, aiming to comply with Brazilian university extension guidelines.""")),)
-
-    pdf.add_page()
-    pdf.set_xy(30, 30)
-    pdf.cell(w=0, h=9, txt=str(_('The WikiConecta is divided into six modules, each one divided into several units:')), border=0, ln=1, align='L')
-    pdf.set_font('Times', 'B', 13)
-    pdf.cell(w=0, h=9, txt=str(_('Module 1: Introduction')), border=0, ln=1, align='L')
-    pdf.set_font('Times', '', 13)
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Free Knowledge: potentials and advantages of using the Wikimedia Projects')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('The Wikimedia Projects and Organizations')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Collective ntelligence and open data')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Wikimedia programs, initiatives and events')), border=0, ln=1, align='L')
-    pdf.set_font('Times', 'B', 13)
-    pdf.cell(w=0, h=9, txt=str(_('Module 2: Wikipedia')), border=0, ln=1, align='L')
-    pdf.set_font('Times', '', 13)
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Wikipedia as an educational resource')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Diffusion and scientific dissemination on Wikipedia')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Content and equity gaps')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Principles and foundations of Wikipedia')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=8, txt=str(_('Entries and arrangement of information')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Editing Wikipedia')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Using Wikipedia with students')), border=0, ln=1, align='L')
-    pdf.set_font('Times', 'B', 13)
-    pdf.cell(w=0, h=9, txt=str(_('Module 3: Wikidata')), border=0, ln=1, align='L')
-    pdf.set_font('Times', '', 13)
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('The Wikimedia structured database')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Getting data: Wikidata Query Service and Scholia')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Entering data: how to use Zotero')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Bias and subjectivity in data')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Editing Wikidata')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Using Wikidata with students')), border=0, ln=1, align='L')
-    pdf.set_font('Times', 'B', 13)
-    pdf.cell(w=0, h=9, txt=str(_('Module 4: Wikimedia Commons')), border=0, ln=1, align='L')
-    pdf.set_font('Times', '', 13)
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Wikimedia audiovisual repository')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Creative commons and free licenses')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('How to use Wikimedia Commons')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('File upload')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Using Wikimedia Commons with students')), border=0, ln=1, align='L')
-    pdf.set_font('Times', 'B', 13)
-    pdf.add_page()
-    pdf.set_xy(30, 30)
-    pdf.cell(w=0, h=9, txt=str(_('Module 5: Wikiversity')), border=0, ln=1, align='L')
-    pdf.set_font('Times', '', 13)
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Wikiversity - the free university')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Open Educational Resources (OER) and Massive Open Online Courses (MOOCs)')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Editing the Wikiversity')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Using Wikiversity with students')), border=0, ln=1, align='L')
-    pdf.set_font('Times', 'B', 13)
-    pdf.cell(w=0, h=9, txt=str(_('Module 6: Education programs')), border=0, ln=1, align='L')
-    pdf.set_font('Times', '', 13)
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Creating an education program with Wiki')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Program monitoring: Dashboard')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Potential financiers')), border=0, ln=1, align='L')
-    pdf.set_x(42.5)
-    pdf.cell(w=50, h=9, txt=str(_('Wikimedia and Education in Brazil')), border=0, ln=1, align='L')
-    pdf.cell(w=0, h=9, ln=1)  # New line
-    pdf.multi_cell(w=0, h=9, border=0, align='J', txt=str(_("""The course is free and the control of activities is carried out by resources on Wikimedia. This letter certifies that {name} is able to participate in the WikiConecta course. If requested, we can issue a declaration of course completion, once the participant has completed the proposed readings and activities.\n\nPlease do not hesitate to contact us to receive further information regarding the course.\n\nYours sincerely,""").format(name=user.first_name + " " + user.last_name)),)
-    pdf.set_font('Times', '', 13)  # Text of the body in Times New Roman, regular, 13 pt
-
-    #######################################################################################################
-    # Footer
-    #######################################################################################################
-    pdf.cell(w=0, h=13, ln=1)  # Give some space for the signatures
-    # Alexander Maximilian Hilsenbeck Filho's signature
-    pdf.image(os.path.join(settings.STATIC_ROOT, 'images/alex.png'), x=56, y=223, w=28, h=16)
-    pdf.set_y(230)
-    pdf.multi_cell(w=80, h=9, border=0, align='C', txt=str(_("_________________________________\nALEXANDER MAXIMILIAN HILSENBECK FILHO\nCoordinator\nWikiConecta")),)
-    pdf.set_xy(110, 230)
-    pdf.image(os.path.join(settings.STATIC_ROOT, 'images/jap.png'), x=140.5, y=227, w=18, h=16)
-    pdf.multi_cell(w=80, h=9, border=0, align='C', txt=str(_("_________________________________\nJOÃO ALEXANDRE PESCHANSKI\nExecutive Director\nWiki Movimento Brasil")),)
+def render_certificate(user, user_hash):
+    """
+    Draws the certificate of completion of a participant
+    """
+    layout = compile_layout("certificate", get_language())
+    pdf = CertificationPDF(orientation=layout["orientation"], unit='mm', format='A4', user_hash=user_hash, footer_text=layout["footer"])
+
+    context = {"name": user.first_name + " " + user.last_name}
+    draw_layout(pdf, layout, context)
 
     # Generate the file
-    file = pdf.output(dest='S').encode('latin-1')
+    return pdf.output(dest='S').encode('latin-1')
 
-    response = HttpResponse(file, content_type='application/pdf')
-    response["Content-Disposition"] = str(_('attachment; filename=WikiConecta - Enrollment - {name}.pdf').format(name=user.username))
-    return response
 
+def get_or_render_document(user, user_hash, render):
+    """
+    Reads an issued document from the store, rendering and storing it the first time it is requested in the
+    current language
+    :param user: owner of the document
+    :param user_hash: validation code of the document
+    :param render: function that draws the document
+    :return: the bytes of the PDF
+    """
+    language = get_language() or settings.LANGUAGE_CODE
+    file = get_document(user_hash, language, printed_name(user))
+    if file is None:
+        file = render(user, user_hash)
+        store_document(user_hash, language, printed_name(user), file)
+    return file
 
-def generate_certificate(user_id=None):
+
+def render_issued_document(certificate_obj):
     """
-    Generates a certificate of completion for the course WikiConecta
+    Reads or renders an issued document in the current language
+    :param Certificate certificate_obj: the document, with its user
+    :return: the bytes of the PDF
     """
-    user = User.objects.get(pk=user_id)
-    certificate_obj, created = Certificate.objects.get_or_create(user_id=user.id, certificate_type="certificate")
-    if created:
-        user_hash = hashlib.sha1(bytes("Enrollment letter " + certificate_obj.user.username + str(certificate_obj.date_issued), 'utf-8')).hexdigest()
-        certificate_obj.certificate_hash = user_hash
-        certificate_obj.save()
+    if certificate_obj.certificate_type == "enrollment":
+        render_document = render_enrollment_letter
     else:
-        user_hash = certificate_obj.certificate_hash
-
-    # Create the page
-    pdf = CertificationPDF(orientation='L', unit='mm', format='A4', user_hash=user_hash)
-    pdf.add_page()
-    pdf.set_text_color(74, 81, 210)  # purple
-
-    #######################################################################################################
-    # Header
-    #######################################################################################################
-    pdf.image(os.path.join(settings.STATIC_ROOT, 'images/wikiconecta-background.png'), x=0, y=0, w=297, h=210)
-    pdf.set_y(20)  # Start the letter text at the 10x42mm point
-
-    pdf.add_font(family='Baloo2-Regular', fname=os.path.join(settings.STATIC_ROOT, 'fonts/Baloo2-Regular.ttf'), uni=True)
-    pdf.add_font(family='Baloo2-Bold', fname=os.path.join(settings.STATIC_ROOT, 'fonts/Baloo2-Bold.ttf'), uni=True)
-    pdf.set_font(family='Baloo2-Regular', size=37)  # Text of the body in Times New Roman, regular, 13 pt
-
-    locale.setlocale(locale.LC_TIME, set_language_if_ptbr(get_language()))  # Setting the language to portuguese for the date
-    pdf.cell(w=0, h=10, border=0, ln=1, align='C', txt=str(_('CERTIFICATE')))
-
-    pdf.set_y(36)
-    pdf.set_font('Baloo2-Regular', '', size=15)
-    pdf.cell(w=0, h=10, border=0, ln=1, align='C', txt=str(_('We grant this certificate to')))
-
-    #######################################################################################################
-    # User name
-    #######################################################################################################
-    name = user.first_name + " " + user.last_name  # User full name
-    pdf.set_font('Baloo2-Regular', '', 35)
-    name_size = pdf.get_string_width(name)
-
-    if name_size > 287:
-        # Try to eliminate the prepositions
-        name_split = [name_part for name_part in name.split(' ') if not name_part.islower()]
-        # There's a first and last names and at least one middle name
-        if len(name_split) > 2:
-            first_name = name_split[0]
-            last_name = name_split[-1]
-            middle_names = [md_name[0] + '.' for md_name in name_split[1:-1]]
-            name = first_name + ' ' + ' '.join(middle_names) + ' ' + last_name
-            name_size = pdf.get_string_width(name)
-
-        # Even abbreviating, there is still the possibility that the name is too big, so
-        # we need to adjust it to the proper size
-        if name_size > 287:
-            pdf.set_font('Baloo2-Regular', '', math.floor(287 * 35 / name_size))
-
-    pdf.set_y(55)
-    pdf.cell(w=0, h=10, border=0, ln=1, align='C', txt=name)
-    pdf.cell(w=0, h=10, ln=1)  # New line
-
-    #######################################################################################################
-    # for having completed the course
-    #######################################################################################################
-    pdf.set_font('Baloo2-Regular', '', 15)
-    pdf.set_y(70)
-    pdf.cell(w=0, h=10, border=0, ln=1, align='C', txt=str(_('for completing the readings and tasks of the online course')))
-
-    #######################################################################################################
-    # Initiative
-    #######################################################################################################
-    pdf.set_xy(164, 86)
-    pdf.set_font('Baloo2-Bold', '', 11)
-    pdf.cell(w=20, h=10, border=0, ln=0, align='L', txt=str(_('Initiative:')))
-
-    #######################################################################################################
-    # Footer
-    #######################################################################################################
-    # Alexander Maximilian Hilsenbeck Filho's signature
-    pdf.set_xy(80, 131)
-    pdf.multi_cell(w=80, h=5, border=0, align='C',
-                   txt=str(
-                       _("_______________________________________\nALEXANDER MAXIMILIAN HILSENBECK FILHO\nCoordinator\nWikiConecta")
-                   ), )
-    pdf.image(os.path.join(settings.STATIC_ROOT, 'images/alex.png'), x=106, y=122, w=28, h=16)
-    # João Alexandre Peschanski's signature
-    pdf.set_xy(155, 131)
-    pdf.multi_cell(w=80, h=5, border=0, align='C', txt=str(
-        _("_________________________________\nJOÃO ALEXANDRE PESCHANSKI\nExecutive Director\nWiki Movimento Brasil")), )
-    pdf.image(os.path.join(settings.STATIC_ROOT, 'images/jap.png'), x=186, y=125, w=18, h=16)
-
-    # Text
-    pdf.set_xy(50, 166)
-    pdf.multi_cell(w=197, h=5, border=0, align='C', txt=str(_('''The WikiConecta course does not have record control, readings and tasks are freely accessible.\nThis certificate is therefore not recognized as an official diploma. The course totals twenty hours.''')))
+        render_document = render_certificate
+    return get_or_render_document(certificate_obj.user, certificate_obj.certificate_hash, render_document)
 
-    # Generate the file
-    file = pdf.output(dest='S').encode('latin-1')
-    # response = HttpResponse(file, content_type='application/pdf')
-    # response["Content-Disposition"] = str(_('attachment; filename=WikiConecta - Certificate of Completion - {name}.pdf').format(name=user.username))
-    # return response
-    return file
+
+def render_exported_document(certificate_obj, language):
+    """
+    Reads or renders an issued document in the given language, from the threads of an export. Like the downloads, a
+    document that is not in the store takes a render slot and is rendered by the online render pool, but it waits
+    for a free slot instead of being refused
+    :raise NoRenderSlot: if no slot is freed in EXPORT_SLOT_WAIT seconds
+    """
+    file = get_document(certificate_obj.certificate_hash, language, printed_name(certificate_obj.user))
+    if file is not None:
+        return file
+    slot = wait_for_render_slot(EXPORT_SLOT_WAIT)
+    pool = online_render_pool()
+    if pool:
+        return pool.render(certificate_obj.id, language, on_done=slot.release)
+    with slot, translation.override(language):
+        return render_issued_document(certificate_obj)
+
+
+def document_response(request, certificate_obj, filename, private):
+    """
+    Serves an issued document. The ETag changes with the validation code, the language, the layout version and the
+    name of the participant, so a client that already has the current version receives a 304 without the document
+    being read or rendered. Documents that are not in the store yet are rendered by the online render pool, and a
+    503 is answered while the pool is full or RENDER_GLOBAL_LIMIT documents are already being rendered
+    :param request: request of the download, only GET and HEAD requests are answered conditionally
+    :param Certificate certificate_obj: the document, with its user
+    :param filename: value of the Content-Disposition header
+    :param private: if the document can only be cached by the browser of the participant
+    """
+    user = certificate_obj.user
+    language = get_language() or settings.LANGUAGE_CODE
+    etag = document_etag(certificate_obj.certificate_hash, language, printed_name(user))
+
+    response = None
+    if request.method in ("GET", "HEAD"):
+        response = get_conditional_response(request, etag=etag)
+    if response is None:
+        file = get_document(certificate_obj.certificate_hash, language, printed_name(user))
+        if file is None:
+            pool = online_render_pool()
+            try:
+                slot = render_slot()
+                if pool:
+                    # The render slot is held until the pool is done with the document, even after a timeout
+                    file = pool.render(certificate_obj.id, language, on_done=slot.release)
+                else:
+                    with slot:
+                        file = render_issued_document(certificate_obj)
+            except (NoRenderSlot, RenderPoolSaturated, BrokenProcessPool):
+                response = HttpResponse(_("Too many documents are being generated right now. Please try again in a few moments."),
+                                        status=503, content_type="text/plain; charset=utf-8")
+                response["Retry-After"] = RETRY_AFTER
+                return response
+        response = HttpResponse(file, content_type='application/pdf')
+        response["Content-Disposition"] = filename
+
+    response["ETag"] = etag
+    if private:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+@user_passes_test(is_organizer)
+def render_status(request):
+    """
+    Occupation of the online render pool of the web worker that answers the request
+    """
+    pool = online_render_pool()
+    return JsonResponse(pool.stats() if pool else {"workers": 0})
 
 
 #######################################
@@ -473,14 +576,41 @@ def build_message(problems, user):
     return message
 
 
-def send_email_to_user(problems, username):
+def send_emails_to_users(decisions):
     """
-    Sends an email with a message to the participant that requested a certificate
+    Queues the emails with the decisions of the organizers to the participants that requested a certificate
+    :param dict decisions: username of each participant and the list of modules in which they have problems in
+    their activities (an empty list approves the participant)
+    :return: the number of emails queued
+    """
+    outbox_emails = []
+    for user_obj in User.objects.filter(username__in=decisions):
+        problems = decisions[user_obj.username]
+        message = build_email_to_user(problems, user_obj)
+        if problems:
+            outbox_emails.append(build_outbox_email(message))
+        else:
+            # The certificate is rendered by the mail worker
+            outbox_emails.append(build_outbox_email(message,
+                                                    certificate=issue_certificate(user_obj, "certificate"),
+                                                    attachment_name=certificate_filename(user_obj.username)))
+
+    OutboxEmail.objects.bulk_create(outbox_emails)
+    return len(outbox_emails)
+
+
+def certificate_filename(username):
+    return str(_("WikiConecta - Certificate of Completion - {name}.pdf")).format(name=username)
+
+
+def build_email_to_user(problems, user_obj):
+    """
+    Builds the email with the decision of the organizers to the participant that requested a certificate. The
+    certificate is attached by the outbox, when the email is sent
     :param list problems: The list of modules in which the participant has problems in their activities
-    :param User user: participant being analyzed
-    :redirect: Manage other certificates
+    :param User user_obj: participant being analyzed
+    :return: the email, ready to be queued
     """
-    user_obj = User.objects.get(username=username)
     from_email = settings.EMAIL_HOST_USER
     to = [user_obj.email]
     bcc = settings.COORDINATORS_EMAILS
@@ -494,14 +624,8 @@ def send_email_to_user(problems, username):
                                      bcc=bcc)
 
     message.attach_alternative(body, "text/html")
-    if not problems:
-        message.attach(filename=str(_("WikiConecta - Certificate of Completion - {name}.pdf")).format(name=username),
-                       content=generate_certificate(user_obj.id),
-                       mimetype='application/pdf')
-
-    message.send()
 
-    return redirect(reverse("manage_certificates"))
+    return message
 
 
 def build_message_for_coordinator(user):
@@ -523,7 +647,7 @@ def build_message_for_coordinator(user):
 
 def send_email_to_coordinator(user):
     """
-    Sends an email with a message to the coordinator informing that the participant requested a certificate
+    Queues an email with a message to the coordinator informing that the participant requested a certificate
     :param User user: participant requesting certificate
     """
     from_email = settings.EMAIL_HOST_USER
@@ -537,4 +661,90 @@ def send_email_to_coordinator(user):
                                      to=to)
 
     message.attach_alternative(body, "text/html")
-    message.send()
+    enqueue_email(message)
+
+
+def build_digest_for_coordinator(users):
+    """
+    Builds the summary of the certificate requests received since the last one
+    :param users: participants that requested a certificate, with their date of request
+    :return: the message to send to the coordinators via email
+    """
+    message_parts = {
+        "greetings": str(_("""Dear coordinators,<br><br>The following participants of the <b>WikiConecta</b> online course have requested that you review their activities and, if correct, send them a certificate of conclusion of the course:""")),
+        "instructions": str(_("""You can find these and other participants with pending evaluations at https://wikiconecta.toolforge.org/manage_certificates.""")),
+        "signature": str(_("""<font style='color:#4A51D2; font-weight:bold; font-style:italic;'>WikiConecta: Wikipedia in all its extension</font><br><a target='_blank' href='https://pt.wikiversity.org/wiki/WikiConecta'>https://pt.wikiversity.org/wiki/WikiConecta</a>"""))
+    }
+
+    requests = "".join("<li><b>{name}</b> (User:{username}) - {date}</li>".format(
+        name=escape(user.first_name + " " + user.last_name),
+        username=escape(user.username),
+        date=timezone.localtime(user.date_of_request).strftime("%Y-%m-%d %H:%M")) for user in users)
+
+    message = message_parts["greetings"] + "<br><ul>" + requests + "</ul><br>" + message_parts["instructions"] + "<br><br>" + message_parts["signature"]
+
+    return message
+
+
+def send_digest_to_coordinator(users):
+    """
+    Queues the summary of the new certificate requests to the coordinators
+    :param users: participants that requested a certificate since the last summary
+    """
+    subject = str(_("WikiConecta - Certificate of Completion requests ({number})")).format(number=len(users))
+    message = EmailMultiAlternatives(subject=subject,
+                                     body="",
+                                     from_email=settings.EMAIL_HOST_USER,
+                                     to=settings.COORDINATORS_EMAILS)
+
+    message.attach_alternative(build_digest_for_coordinator(users), "text/html")
+    enqueue_email(message)
+
+
+def enqueue_email(message, certificate=None, attachment_name=""):
+    """
+    Saves an email in the outbox, to be sent by the send_emails command instead of during the request
+    :return: the OutboxEmail
+    """
+    outbox_email = build_outbox_email(message, certificate, attachment_name)
+    outbox_email.save()
+    return outbox_email
+
+
+def build_outbox_email(message, certificate=None, attachment_name=""):
+    """
+    Builds the outbox entry of an email, without saving it
+    :param EmailMultiAlternatives message: email with its HTML body
+    :param Certificate certificate: document to attach, rendered when the email is sent
+    :param attachment_name: file name of the attached document
+    :return: the OutboxEmail
+    """
+    return OutboxEmail(subject=message.subject,
+                       body=message.alternatives[0][0],
+                       from_email=message.from_email,
+                       to=list(message.to),
+                       bcc=list(message.bcc),
+                       certificate=certificate,
+                       attachment_name=attachment_name,
+                       language=get_language() or settings.LANGUAGE_CODE)
+
+
+def build_outbox_message(outbox_email):
+    """
+    Builds the email of an outbox entry, attaching its document
+    :param OutboxEmail outbox_email: entry of the outbox
+    :return: the email, ready to be sent
+    """
+    message = EmailMultiAlternatives(subject=outbox_email.subject,
+                                     body="",
+                                     from_email=outbox_email.from_email,
+                                     to=outbox_email.to,
+                                     bcc=outbox_email.bcc)
+    message.attach_alternative(outbox_email.body, "text/html")
+
+    if outbox_email.certificate:
+        with translation.override(outbox_email.language):
+            content = render_issued_document(outbox_email.certificate)
+        message.attach(filename=outbox_email.attachment_name, content=content, mimetype='application/pdf')
+
+    return message
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class EducationProgramConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'education_program'
+
+    def ready(self):
+        from education_program import signals  # noqa: F401
@@ -0,0 +1,65 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from education_program.models import EducationProgram, Institution, Professor
+from education_program.wiki import forget_fragments
+
+# Actions of m2m_changed after which the programs of an institution, or the professors of a program, are different.
+# The links removed by clear() are only known before they are removed
+M2M_ACTIONS = ("pre_clear", "post_add", "post_remove")
+
+
+def institutions_of_programs(programs):
+    return Institution.objects.filter(education_program_institution__in=programs).values_list("id", "state").distinct()
+
+
+@receiver(pre_save, sender=Institution)
+def forget_previous_state_of_institution(sender, instance, **kwargs):
+    """
+    An institution moved to another state leaves the text of its previous state
+    """
+    if instance.pk:
+        forget_fragments(Institution.objects.filter(pk=instance.pk).values_list("id", "state"))
+
+
+@receiver(post_save, sender=Institution)
+@receiver(post_delete, sender=Institution)
+def forget_institution(sender, instance, **kwargs):
+    forget_fragments([(instance.id, instance.state)])
+
+
+@receiver(post_save, sender=EducationProgram)
+@receiver(pre_delete, sender=EducationProgram)
+def forget_institutions_of_program(sender, instance, **kwargs):
+    forget_fragments(institutions_of_programs([instance.pk]))
+
+
+@receiver(post_save, sender=Professor)
+@receiver(pre_delete, sender=Professor)
+def forget_institutions_of_professor(sender, instance, **kwargs):
+    forget_fragments(institutions_of_programs(instance.education_program_professor.values("id")))
+
+
+@receiver(m2m_changed, sender=EducationProgram.institution.through)
+def forget_institutions_linked(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in M2M_ACTIONS:
+        return
+    if reverse:
+        # The programs of an institution changed
+        forget_fragments([(instance.id, instance.state)])
+    elif action == "pre_clear":
+        forget_fragments(institutions_of_programs([instance.pk]))
+    else:
+        forget_fragments(Institution.objects.filter(id__in=pk_set).values_list("id", "state"))
+
+
+@receiver(m2m_changed, sender=EducationProgram.professor.through)
+def forget_institutions_of_professors_linked(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in M2M_ACTIONS:
+        return
+    if not reverse:
+        forget_fragments(institutions_of_programs([instance.pk]))
+    elif action == "pre_clear":
+        forget_fragments(institutions_of_programs(instance.education_program_professor.values("id")))
+    else:
+        forget_fragments(institutions_of_programs(pk_set))
@@ -1,3 +1,148 @@
-from django.test import TestCase
+from datetime import date
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import translation
+
+from .models import EducationProgram, Institution, Professor
+from .wiki import PAGE_HEADER, build_states
+
+STATES = (("SP", "São Paulo"), ("RJ", "Rio de Janeiro"), ("AC", "Acre"))
+
+EXPECTED_STATES = PAGE_HEADER + """
+
+==São Paulo==
+''3 programas de educação registrados até o momento''
+{{:WikiConecta/Instituição
+  |instituição    = Universidade "Federal" <b>Paulista</b>
+  |instituição_id = {usp}
+  |programas      = 
+    {{:WikiConecta/Programa de educação
+      |nome_curso        = Wikipédia na sala de aula
+      |id_curso          = {classroom}
+      |link              = https://outreachdashboard.wmflabs.org/courses/Grupo/Sala
+      |data_início       = 2023-03-01
+      |data_fim          = 2023-07-15
+      |número_estudantes = 
+      |modalidade        = Presencial
+      |docente_1         = [[Utilizador(a):Ana (WMB)|Ana Souza]]
+      |docente_2         = Carlos "Cacá" Lima
+    }}
+    {{:WikiConecta/Programa de educação
+      |nome_curso        = Oficina de Wikidata
+      |id_curso          = {workshop}
+      |link              = 
+      |data_início       = 2024-02-10
+      |data_fim          = 2024-02-11
+      |número_estudantes = 
+      |modalidade        = Online
+
+    }}
+}}
+
+{{:WikiConecta/Instituição
+  |instituição    = Instituto Municipal
+  |instituição_id = {institute}
+  |programas      = 
+    {{:WikiConecta/Programa de educação
+      |nome_curso        = Wikipédia na sala de aula
+      |id_curso          = {classroom}
+      |link              = https://outreachdashboard.wmflabs.org/courses/Grupo/Sala
+      |data_início       = 2023-03-01
+      |data_fim          = 2023-07-15
+      |número_estudantes = 
+      |modalidade        = Presencial
+      |docente_1         = [[Utilizador(a):Ana (WMB)|Ana Souza]]
+      |docente_2         = Carlos "Cacá" Lima
+    }}
+}}
+
+==Rio de Janeiro==
+''1 programa de educação registrado até o momento''
+{{:WikiConecta/Instituição
+  |instituição    = Universidade do Rio
+  |instituição_id = {rio}
+  |programas      = 
+    {{:WikiConecta/Programa de educação
+      |nome_curso        = Escrita colaborativa
+      |id_curso          = {writing}
+      |link              = https://example.org/escrita
+      |data_início       = 2022-08-01
+      |data_fim          = 2022-12-01
+      |número_estudantes = 25
+      |modalidade        = Híbrido
+      |docente_1         = Beatriz <i>Costa</i>
+    }}
+}}
+
+==Acre==
+
+"""
+
+
+@override_settings(STATES=STATES, CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class BuildStatesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        usp = Institution.objects.create(name='Universidade "Federal" <b>Paulista</b>', postal_code="05508-000", state="SP")
+        institute = Institution.objects.create(name="Instituto Municipal", postal_code="01000-000", state="SP")
+        rio = Institution.objects.create(name="Universidade do Rio", postal_code="20000-000", state="RJ")
+        Institution.objects.create(name="Instituto sem programas", postal_code="69900-000", state="AC")
+
+        ana = Professor.objects.create(name="Ana Souza", username="Ana (WMB)")
+        beatriz = Professor.objects.create(name="Beatriz <i>Costa</i>")
+        carlos = Professor.objects.create(name='Carlos "Cacá" Lima')
+
+        classroom = EducationProgram.objects.create(
+            name="Wikipédia na sala de aula", start_date=date(2023, 3, 1), end_date=date(2023, 7, 15),
+            link="https://outreachdashboard.wmflabs.org/courses/Grupo/Sala", course_type="in_person",
+            number_students=None)
+        # Linked out of the order of their ids, the professors are still listed by id
+        classroom.professor.add(carlos)
+        classroom.professor.add(ana)
+        classroom.institution.add(institute)
+        classroom.institution.add(usp)
+
+        workshop = EducationProgram.objects.create(
+            name="Oficina de Wikidata", start_date=date(2024, 2, 10), end_date=date(2024, 2, 11), link=None,
+            course_type="online", number_students=0)
+        workshop.institution.add(usp)
+
+        writing = EducationProgram.objects.create(
+            name="Escrita colaborativa", start_date=date(2022, 8, 1), end_date=date(2022, 12, 1),
+            link="https://example.org/escrita", course_type="hybrid", number_students=25)
+        writing.professor.add(beatriz)
+        writing.institution.add(rio)
+
+        cls.ids = {"usp": usp.id, "institute": institute.id, "rio": rio.id,
+                   "classroom": classroom.id, "workshop": workshop.id, "writing": writing.id}
+
+    def setUp(self):
+        cache.clear()
+
+    def expected(self):
+        text = EXPECTED_STATES
+        for name, value in self.ids.items():
+            text = text.replace("{" + name + "}", str(value))
+        return text
+
+    def test_build_states(self):
+        with translation.override("pt-br"):
+            self.assertEqual(build_states(), self.expected())
+
+    def test_build_states_queries(self):
+        with translation.override("pt-br"), self.assertNumQueries(4):
+            build_states()
+
+    def test_build_states_after_change(self):
+        with translation.override("pt-br"):
+            build_states()
+            writing = EducationProgram.objects.get(id=self.ids["writing"])
+            writing.number_students = 30
+            # The cached text is discarded when the change is committed
+            with self.captureOnCommitCallbacks(execute=True):
+                writing.save()
+            # Only the state of the program changed is read again
+            with self.assertNumQueries(4):
+                text = build_states()
+        self.assertEqual(text, self.expected().replace("|número_estudantes = 25", "|número_estudantes = 30"))
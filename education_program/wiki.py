@@ -1,12 +1,24 @@
+import io
+import json
+from collections import defaultdict
+
 import pandas as pd
 from django.conf import settings
-from django.db.models import Sum, F
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Prefetch, Sum
+from django.db.models.functions import Coalesce
+from django.utils.translation import get_language
 from social_django.models import UserSocialAuth
 from requests_oauthlib import OAuth1Session
-from .models import EducationProgram, Institution
+from .models import EducationProgram, Institution, Professor
+
+WIKI_API_URL = "https://pt.wikiversity.org/w/api.php"
+# Revisions or titles per query, the limit of the API for users without the apihighlimits right
+API_BATCH_SIZE = 50
 
 
-def api_request(request, params, method):
+def api_request(request, params, method, url=WIKI_API_URL):
     usersocialauth = UserSocialAuth.objects.filter(provider='mediawiki', user=request.user).first()
     oauth_token = usersocialauth.extra_data.get('access_token').get('oauth_token')
     oauth_token_secret = usersocialauth.extra_data.get('access_token').get('oauth_token_secret')
@@ -17,7 +29,6 @@ def api_request(request, params, method):
         resource_owner_secret=oauth_token_secret
     )
 
-    url = "https://pt.wikiversity.org/w/api.php"
     if method == "POST":
         return client.post(url, data=params, timeout=4)
     else:
@@ -74,34 +85,228 @@ def edit_page(request, title, text, summary):
     print(response.json())
 
 
-def build_states():
-    states = dict(settings.STATES)
-    text = "__NOTOC____NOEDITSECTION__<templatestyles src=\"WikiConecta/Programas de educação.css\"/>\n" + \
-           "<noinclude>{{:WikiConecta/Programas de educação/Wikimedia e Educação no Brasil/script/nota}}</noinclude>\n" + \
-           "{{:WikiConecta/Programas de educação/Wikimedia e Educação no Brasil/script/texto}}\n" +\
-           "{{:WikiConecta/Mapa dos programas de educação brasileiros}}\n" +\
-           "{{:WikiConecta/Adicionar programa de educação}}"
+def batches(values, size=API_BATCH_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
 
-    for state, state_name in states.items():
-        text += "\n\n" + build_state(state)
 
-    text += "\n"
+def query_revisions(request, url, field, values):
+    """
+    Queries the metadata of a batch of revisions, by their ids (field "revids") or by the titles of their pages
+    (field "titles", the latest revision of each page)
+    :return: the "query" object of the response
+    """
+    params = {
+        "action": "query",
+        "prop": "revisions",
+        field: "|".join(str(value) for value in values),
+        "rvprop": "ids|user|timestamp|size",
+        "format": "json",
+        "formatversion": 2,
+    }
+    return api_request(request, params, "GET", url).json().get("query", {})
+
+
+def get_revisions(request, url, revids=(), titles=()):
+    """
+    Metadata of many revisions of a wiki, fetched API_BATCH_SIZE at a time. The size of the parent revisions is
+    fetched the same way, to know how much each revision changed the page
+    :param request: request of a user logged in with their Wikimedia account
+    :param url: address of the API of the wiki
+    :param revids: ids of revisions
+    :param titles: titles of pages, whose latest revision is fetched
+    :return: dictionaries of revid and of title to the revision (with revid, parentid, title, user, timestamp,
+    size and size_delta). Revisions and pages that don't exist or are hidden are missing from them
+    """
+    by_revid = {}
+    by_title = {}
+    for batch in batches(set(revids)):
+        for page in query_revisions(request, url, "revids", batch).get("pages", []):
+            for revision in page.get("revisions", []):
+                by_revid[revision["revid"]] = dict(revision, title=page["title"])
+    for batch in batches(set(titles)):
+        query = query_revisions(request, url, "titles", batch)
+        asked = {item["to"]: item["from"] for item in query.get("normalized", [])}
+        for page in query.get("pages", []):
+            for revision in page.get("revisions", []):
+                by_title[asked.get(page["title"], page["title"])] = dict(revision, title=page["title"])
+
+    revisions = list(by_revid.values()) + list(by_title.values())
+    sizes = {revision["revid"]: revision.get("size") for revision in revisions}
+    parentids = {revision["parentid"] for revision in revisions if revision.get("parentid")} - set(sizes)
+    for batch in batches(parentids):
+        for page in query_revisions(request, url, "revids", batch).get("pages", []):
+            for revision in page.get("revisions", []):
+                sizes[revision["revid"]] = revision.get("size")
+
+    for revision in revisions:
+        parent_size = sizes.get(revision.get("parentid")) if revision.get("parentid") else 0
+        if revision.get("size") is None or parent_size is None:
+            revision["size_delta"] = None
+        else:
+            revision["size_delta"] = revision["size"] - parent_size
+    return by_revid, by_title
+
+
+#######################################
+# PAGE OF THE EDUCATION PROGRAMS
+#######################################
+PAGE_HEADER = "__NOTOC____NOEDITSECTION__<templatestyles src=\"WikiConecta/Programas de educação.css\"/>\n" + \
+              "<noinclude>{{:WikiConecta/Programas de educação/Wikimedia e Educação no Brasil/script/nota}}</noinclude>\n" + \
+              "{{:WikiConecta/Programas de educação/Wikimedia e Educação no Brasil/script/texto}}\n" + \
+              "{{:WikiConecta/Mapa dos programas de educação brasileiros}}\n" + \
+              "{{:WikiConecta/Adicionar programa de educação}}"
+
+
+# The text of each state and of each institution is cached until one of its programs, institutions or professors
+# changes (see signals.py), so only the states changed are read again. The cache is shared by the web workers, so a
+# change made in one of them reaches the others. The text also expires after a day, in case a change is made
+# without the signals, like by QuerySet.update()
+FRAGMENT_CACHE_PREFIX = "education_program:fragment"
+FRAGMENT_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def fragment_key(kind, identifier, language=None):
+    return "{}:{}:{}:{}".format(FRAGMENT_CACHE_PREFIX, kind, identifier, language or get_language() or settings.LANGUAGE_CODE)
+
+
+def forget_fragments(institutions):
+    """
+    Discards the cached text of institutions and of their states, in every language, once the current transaction
+    is committed
+    :param institutions: iterable of (id, state) of the institutions changed
+    """
+    languages = {code for code, name in settings.LANGUAGES} | {settings.LANGUAGE_CODE}
+    keys = []
+    for institution_id, state in institutions:
+        for language in languages:
+            keys.append(fragment_key("institution", institution_id, language))
+            if state:
+                keys.append(fragment_key("state", state, language))
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class ProgramsSnapshot:
+    """
+    The institutions with education programs of some states and their links to the programs, loaded in two queries.
+    The programs and their professors are loaded in two more queries, only for the institutions whose text is built.
+    The institutions, programs and professors are in the order of their ids
+    """
+    def __init__(self, states):
+        institutions = (Institution.objects
+                        .filter(state__in=states, education_program_institution__isnull=False)
+                        .distinct()
+                        .order_by("id"))
+        links = (EducationProgram.institution.through.objects
+                 .filter(institution__state__in=states)
+                 .order_by("educationprogram_id")
+                 .values_list("institution_id", "educationprogram_id"))
+
+        self.institutions_by_state = defaultdict(list)
+        for institution in institutions:
+            self.institutions_by_state[institution.state].append(institution)
+        self.program_ids_by_institution = defaultdict(list)
+        for institution_id, program_id in links:
+            self.program_ids_by_institution[institution_id].append(program_id)
+        self.programs = {}
+
+    def number_of_education_programs(self, state):
+        # A program of two institutions of the state is counted for each of them
+        return sum(len(self.program_ids_by_institution[institution.id]) for institution in self.institutions_by_state[state])
+
+    def load_programs(self, institutions):
+        program_ids = {program_id for institution in institutions for program_id in self.program_ids_by_institution[institution.id]}
+        program_ids -= set(self.programs)
+        if program_ids:
+            professors = Prefetch("professor", queryset=Professor.objects.order_by("id"))
+            for program in EducationProgram.objects.filter(id__in=program_ids).prefetch_related(professors):
+                self.programs[program.id] = program
+
+    def programs_of(self, institution):
+        return [self.programs[program_id] for program_id in self.program_ids_by_institution[institution.id]]
 
-    return text
 
+def build_states():
+    """
+    Wikitext of the page of the education programs, with the institutions and programs of each state. The page is
+    assembled from the cached text of each state, and only the states changed since the page was last built are
+    read from the database
+    :return: the wikitext of the page
+    """
+    states = dict(settings.STATES)
+    fragments = state_fragments(list(states))
+    stream = io.StringIO()
+    stream.write(PAGE_HEADER)
+    for state in states:
+        stream.write("\n\n")
+        stream.write(fragments[state])
+    stream.write("\n")
+    return stream.getvalue()
 
-def build_state(state):
-    states = settings.STATES
-    institutions = Institution.objects.filter(state=state, education_program_institution__institution__isnull=False).distinct()
-    number_of_education_programs = EducationProgram.objects.filter(institution__state=state).count()
 
-    if not number_of_education_programs:
-        text = "==" + dict(states)[state] + "==\n"
-    else:
-        text = "==" + dict(states)[state] + "==\n''" +\
-               build_number_of_education_programs_phrase(number_of_education_programs) +\
-               "\n\n".join([build_institution(institution) for institution in institutions])
-    return text
+def build_state(state):
+    """
+    Wikitext of a state, with its institutions and programs
+    """
+    return state_fragments([state])[state]
+
+
+def state_fragments(states):
+    """
+    Wikitext of each state, from the cache or built from a snapshot of the states missing from it
+    :return: dictionary of state to its wikitext
+    """
+    keys = {state: fragment_key("state", state) for state in states}
+    cached = cache.get_many(list(keys.values()))
+    fragments = {state: cached[key] for state, key in keys.items() if key in cached}
+    missing = [state for state in states if state not in fragments]
+    if not missing:
+        return fragments
+
+    snapshot = ProgramsSnapshot(missing)
+    institutions = institution_fragments(snapshot, [institution for state in missing for institution in snapshot.institutions_by_state[state]])
+    built = {}
+    for state in missing:
+        stream = io.StringIO()
+        write_state(stream, snapshot, state, institutions)
+        built[state] = stream.getvalue()
+    cache.set_many({keys[state]: text for state, text in built.items()}, FRAGMENT_CACHE_TIMEOUT)
+    fragments.update(built)
+    return fragments
+
+
+def institution_fragments(snapshot, institutions):
+    """
+    Wikitext of each institution, from the cache or built from the snapshot. Only the programs of the institutions
+    missing from the cache are loaded
+    :return: dictionary of the id of the institution to its wikitext
+    """
+    keys = {institution.id: fragment_key("institution", institution.id) for institution in institutions}
+    cached = cache.get_many(list(keys.values()))
+    fragments = {institution_id: cached[key] for institution_id, key in keys.items() if key in cached}
+    missing = [institution for institution in institutions if institution.id not in fragments]
+    if not missing:
+        return fragments
+
+    snapshot.load_programs(missing)
+    built = {}
+    for institution in missing:
+        stream = io.StringIO()
+        write_institution(stream, snapshot, institution)
+        built[institution.id] = stream.getvalue()
+    cache.set_many({keys[institution_id]: text for institution_id, text in built.items()}, FRAGMENT_CACHE_TIMEOUT)
+    fragments.update(built)
+    return fragments
+
+
+def write_state(stream, snapshot, state, institutions):
+    stream.write("==" + dict(settings.STATES)[state] + "==\n")
+    number_of_education_programs = snapshot.number_of_education_programs(state)
+    if number_of_education_programs:
+        stream.write("''" + build_number_of_education_programs_phrase(number_of_education_programs))
+        stream.write("\n\n".join(institutions[institution.id] for institution in snapshot.institutions_by_state[state]))
 
 
 def build_number_of_education_programs_phrase(number_of_education_programs):
@@ -111,18 +316,19 @@ def build_number_of_education_programs_phrase(number_of_education_programs):
         return str(number_of_education_programs) + " programas de educação registrados até o momento''\n"
 
 
-def build_institution(institution):
-    education_programs = EducationProgram.objects.filter(institution=institution)
-    text = """{{:WikiConecta/Instituição\n""" +\
-           """  |instituição    = """ + institution.name + """\n""" + \
-           """  |instituição_id = """ + str(institution.id) + """\n""" +\
-           """  |programas      = \n""" +\
-           "\n".join([build_education_program(education_program) for education_program in education_programs]) +\
-           """\n}}"""
-    return text
+def write_institution(stream, snapshot, institution):
+    stream.write("{{:WikiConecta/Instituição\n"
+                 "  |instituição    = " + institution.name + "\n"
+                 "  |instituição_id = " + str(institution.id) + "\n"
+                 "  |programas      = \n")
+    for index, education_program in enumerate(snapshot.programs_of(institution)):
+        if index:
+            stream.write("\n")
+        write_education_program(stream, education_program)
+    stream.write("\n}}")
 
 
-def build_education_program(education_program):
+def write_education_program(stream, education_program):
     name = education_program.name if education_program.name else ""
     link = education_program.link if education_program.link else ""
     start_date = education_program.start_date.strftime('%Y-%m-%d') if education_program.start_date else ""
@@ -130,16 +336,16 @@ def build_education_program(education_program):
     number_students = str(education_program.number_students) if education_program.number_students else ""
     course_type = education_program.get_course_type_display() if education_program.course_type else ""
 
-    text = """    {{:WikiConecta/Programa de educação\n""" +\
-           """      |nome_curso        = """ + name + """\n""" + \
-           """      |id_curso          = """ + str(education_program.id) + """\n""" + \
-           """      |link              = """ + link + """\n""" +\
-           """      |data_início       = """ + start_date + """\n""" +\
-           """      |data_fim          = """ + end_date + """\n""" +\
-           """      |número_estudantes = """ + number_students + """\n""" +\
-           """      |modalidade        = """ + course_type + """\n""" + \
-           build_professors_fields(list(education_program.professor.all())) + """\n    }}"""
-    return text
+    stream.write("    {{:WikiConecta/Programa de educação\n"
+                 "      |nome_curso        = " + name + "\n"
+                 "      |id_curso          = " + str(education_program.id) + "\n"
+                 "      |link              = " + link + "\n"
+                 "      |data_início       = " + start_date + "\n"
+                 "      |data_fim          = " + end_date + "\n"
+                 "      |número_estudantes = " + number_students + "\n"
+                 "      |modalidade        = " + course_type + "\n")
+    stream.write(build_professors_fields(education_program.professor.all()))
+    stream.write("\n    }}")
 
 
 def build_professors_fields(professors):
@@ -152,12 +358,21 @@ def build_professors_fields(professors):
     return "\n".join(professors_list)
 
 
+#######################################
+# MAP OF THE EDUCATION PROGRAMS
+#######################################
+# Institutions without coordinates are placed at 0, 0 in another color, to be found and fixed
+MARKER_COLOR = "4a51d2"
+MARKER_COLOR_WITHOUT_COORDINATES = "d24a4a"
+
+
 def build_mapframe():
     text = "<mapframe width=\"500\" height=\"500\" zoom=\"4\" longitude=\"-55\" latitude=\"-16\" align=\"right\" " +\
            "text=\"'''Programas de Educação Brasileiros'''\">\n" +\
            "{\n" +\
            "  \"type\": \"FeatureCollection\",\n" +\
-           "  \"features\": [\n" + build_features() + "\n"\
+           "  \"features\": [\n" +\
+           ",\n".join("    " + encode_feature(feature) for feature in build_features()) + "\n" +\
            "  ]\n" +\
            "}\n" +\
            "</mapframe>"
@@ -165,23 +380,37 @@ def build_mapframe():
     return text
 
 
+def encode_feature(feature):
+    # "<" is escaped so a name can't close the mapframe tag
+    return json.dumps(feature, ensure_ascii=False).replace("<", "\\u003c")
+
+
 def build_features():
-    text = []
-    institutions = Institution.objects.filter(education_program_institution__institution__isnull=False).distinct()
+    """
+    GeoJSON features of the institutions with education programs, with their number of programs and students. The
+    numbers of every institution are counted by a single query
+    :return: list of the features, in the order of the ids of the institutions
+    """
+    institutions = (Institution.objects
+                    .annotate(number_of_education_programs=Count("education_program_institution"),
+                              number_of_students=Coalesce(Sum("education_program_institution__number_students"), 0))
+                    .filter(number_of_education_programs__gt=0)
+                    .order_by("id"))
+    features = []
     for institution in institutions:
-        number_of_education_programs = EducationProgram.objects.filter(institution=institution).count()
-        number_of_students = EducationProgram.objects.filter(institution=institution).aggregate(total=Sum(F("number_students")))["total"]
-        if number_of_education_programs > 0:
-            if institution.lat == 0 and institution.lon == 0:
-                text.append("    { \"type\": \"Feature\", \"geometry\": { \"type\": \"Point\", \"coordinates\": [" +
-                            str(institution.lon) + ", " + str(institution.lat) + "] }, \"properties\": { \"title\": \"" +
-                            institution.name + "\", \"description\": \"{{:WikiConecta/Instituição/Descrição no mapa|" +
-                            str(institution.id) + "|" + str(number_of_education_programs) + "|" + str(number_of_students) +
-                            "}}\", \"marker-size\": \"small\", \"marker-color\": \"d24a4a\", \"stroke-width\": 0 } }")
-            else:
-                text.append("    { \"type\": \"Feature\", \"geometry\": { \"type\": \"Point\", \"coordinates\": [" +
-                            str(institution.lon) + ", " + str(institution.lat) + "] }, \"properties\": { \"title\": \"" +
-                            institution.name + "\", \"description\": \"{{:WikiConecta/Instituição/Descrição no mapa|" +
-                            str(institution.id) + "|" + str(number_of_education_programs) + "|" + str(number_of_students) +
-                            "}}\", \"marker-size\": \"small\", \"marker-color\": \"4a51d2\", \"stroke-width\": 0 } }")
-    return ",\n".join(text)
+        lat = institution.lat or 0
+        lon = institution.lon or 0
+        description = "{{{{:WikiConecta/Instituição/Descrição no mapa|{}|{}|{}}}}}".format(
+            institution.id, institution.number_of_education_programs, institution.number_of_students)
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [lon, lat]},
+            "properties": {
+                "title": institution.name,
+                "description": description,
+                "marker-size": "small",
+                "marker-color": MARKER_COLOR_WITHOUT_COORDINATES if lat == 0 and lon == 0 else MARKER_COLOR,
+                "stroke-width": 0,
+            },
+        })
+    return features
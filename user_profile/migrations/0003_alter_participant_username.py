@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_profile', '0002_participant_enrolled_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='participant',
+            name='username',
+            field=models.CharField(blank=True, db_index=True, max_length=150, verbose_name='username'),
+        ),
+    ]
@@ -58,7 +58,7 @@ class UserModification(models.Model):
 
 
 class Participant(models.Model):
-    username = models.CharField(_("username"), max_length=150, blank=True)
+    username = models.CharField(_("username"), max_length=150, blank=True, db_index=True)
     last_date = models.DateTimeField(auto_now=True)
     enrolled_at = models.DateTimeField(null=True, blank=True)
 
@@ -97,6 +97,17 @@ LOGIN_REDIRECT_URL = 'homepage'
 
 WSGI_APPLICATION = 'wikiconecta.wsgi.application'
 
+# Cache shared by the web workers and the commands, as it holds state that must be the same for all of them: the
+# rate limits, the render slots and the text of the education programs page. Its table is created with
+# "python manage.py createcachetable"
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'wikiconecta_cache',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -143,6 +154,46 @@ STATIC_URL = '/static/'
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
+# Issued certificates and enrollment letters, stored once they are rendered
+CERTIFICATES_ROOT = os.path.join(BASE_DIR, 'certificates')
+
+# Instead of one email per certificate request, the coordinators receive a summary of the new requests sent by
+# the send_coordinator_digest command, that must be scheduled
+COORDINATOR_DIGEST = False
+
+# Processes of each web worker that render the documents requested online (0 renders them in the web worker itself),
+# documents that may wait for one of them and seconds a request waits for its document
+RENDER_WORKERS = 2
+RENDER_QUEUE_SIZE = 4
+RENDER_TIMEOUT = 30
+# Python interpreter that runs the render processes, when the web workers are not run by one (as with uWSGI)
+RENDER_PYTHON = None
+# Documents rendered at the same time by all the web workers. The slots are kept in the shared cache
+RENDER_GLOBAL_LIMIT = 4
+# Seconds after which the slot of a render that never finished is freed. It must be longer than the slowest render,
+# as the render pool keeps rendering a document after the request stops waiting for it
+RENDER_SLOT_TIMEOUT = 10 * 60
+
+# Requests per RATE_LIMIT_PERIOD seconds accepted from each client address and from each user by the views that
+# generate documents. Behind a proxy, RATE_LIMIT_IP_HEADER is the header with the address of the client,
+# like "HTTP_X_FORWARDED_FOR"
+RATE_LIMITS = {
+    "validate": {"ip": 30, "user": 30},
+    "enrollment_letter": {"ip": 20, "user": 10},
+}
+RATE_LIMIT_PERIOD = 60
+RATE_LIMIT_IP_HEADER = None
+
+# Checker of the activity links (check_activity_links command): requests sent at a time, requests sent at a time to
+# the same host, seconds between the requests to the same host, seconds to wait for each response and hours after
+# which a link is checked again. Links to private addresses are refused, unless LINK_CHECK_PRIVATE_ADDRESSES is True
+LINK_CHECK_WORKERS = 8
+LINK_CHECK_PER_HOST = 2
+LINK_CHECK_DELAY = 0.5
+LINK_CHECK_TIMEOUT = 10
+LINK_CHECK_MAX_AGE = 24
+LINK_CHECK_PRIVATE_ADDRESSES = False
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 